@@ -0,0 +1,105 @@
+from web3 import Web3
+from typing import Dict, List, Optional, Tuple
+
+from multicall import aggregate, eth_balance_call, token_balance_call
+from results_sink import TRANSFER_TOPIC
+
+# 单次 eth_getLogs 查询的最大区块数（公共 BSC 节点会拒绝过大的范围）
+LOG_CHUNK_BLOCKS = 2000
+
+
+class BalanceLedger:
+    """
+    钱包集合的增量余额账本
+    先在某个区块做一次 multicall 快照，之后：
+    - 代币余额按 Transfer 日志增量更新（每个区块范围一次 eth_getLogs）
+    - BNB 余额按我们自己交易的收据更新（转账金额 + gas 费）
+    合约内部转出的 BNB（例如卖币换回的 BNB）不会出现在日志中，这类场景需要重新快照
+    """
+
+    def __init__(self, addresses: List[str], token: Optional[str] = None,
+                 log_chunk_blocks: int = LOG_CHUNK_BLOCKS):
+        self.addresses = [Web3.to_checksum_address(a) for a in addresses]
+        self.token = Web3.to_checksum_address(token) if token else None
+        self.log_chunk_blocks = log_chunk_blocks
+        self.block = 0
+        self.snapshot_block = 0
+        self.bnb: Dict[str, int] = {}
+        self.tokens: Dict[str, int] = {}
+        # 日志 topic 中的地址（32 字节左补零） -> checksum 地址
+        self._by_topic = {bytes(12) + bytes.fromhex(a[2:]): a for a in self.addresses}
+        self._applied = set()
+
+    async def snapshot(self, w3_async, block_identifier=None):
+        """在指定区块（默认最新）读取全部余额"""
+        block = block_identifier if block_identifier is not None else await w3_async.eth.block_number
+        calls = [eth_balance_call(a) for a in self.addresses]
+        if self.token:
+            calls += [token_balance_call(self.token, a) for a in self.addresses]
+
+        values = await aggregate(w3_async, calls, block)
+        count = len(self.addresses)
+        for i, address in enumerate(self.addresses):
+            self.bnb[address] = values[i] or 0
+            self.tokens[address] = (values[count + i] or 0) if self.token else 0
+        self.block = block
+        self.snapshot_block = block
+        self._applied.clear()
+
+    def apply_receipt(self, receipt, value: int = 0):
+        """
+        按我们自己发出的交易收据更新 BNB 余额
+        value 取自签名前的交易（收据中没有转账金额）
+        """
+        tx_hash = bytes(receipt['transactionHash'])
+        if tx_hash in self._applied or receipt['blockNumber'] <= self.snapshot_block:
+            return
+        self._applied.add(tx_hash)
+
+        sender = Web3.to_checksum_address(receipt['from'])
+        to = Web3.to_checksum_address(receipt['to']) if receipt['to'] else None
+        succeeded = receipt['status'] == 1
+
+        if sender in self.bnb:
+            self.bnb[sender] -= receipt['gasUsed'] * receipt['effectiveGasPrice']
+            if succeeded:
+                self.bnb[sender] -= value
+        if succeeded and to in self.bnb:
+            self.bnb[to] += value
+
+    async def sync(self, w3_async, to_block: int):
+        """
+        应用 (已同步区块, to_block] 内与钱包集合相关的代币 Transfer 日志
+        按 log_chunk_blocks 分段查询，每段完成后推进 self.block，出错时已应用的部分不会重复
+        """
+        if not self.token:
+            self.block = max(self.block, to_block)
+            return
+
+        while self.block < to_block:
+            chunk_end = min(self.block + self.log_chunk_blocks, to_block)
+            logs = await w3_async.eth.get_logs({
+                'address': self.token,
+                'fromBlock': self.block + 1,
+                'toBlock': chunk_end,
+                'topics': [TRANSFER_TOPIC],
+            })
+            for log in logs:
+                if len(log['topics']) != 3:
+                    continue
+                amount = int.from_bytes(bytes(log['data']), 'big')
+                sender = self._by_topic.get(bytes(log['topics'][1]))
+                recipient = self._by_topic.get(bytes(log['topics'][2]))
+                if sender:
+                    self.tokens[sender] -= amount
+                if recipient:
+                    self.tokens[recipient] += amount
+            self.block = chunk_end
+
+    def balance(self, address: str) -> Tuple[int, int]:
+        """(BNB, 代币) 余额，单位 wei"""
+        address = Web3.to_checksum_address(address)
+        return self.bnb[address], self.tokens[address]
+
+    def balances(self) -> List[Tuple[int, int]]:
+        return [self.balance(a) for a in self.addresses]
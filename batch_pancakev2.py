@@ -4,49 +4,78 @@ from datetime import datetime, timedelta
 import os
 from dotenv import load_dotenv
 import asyncio
-from typing import List, Dict
+import time
+from typing import List, Dict, Optional
+import argparse
+
+from rpc_cassette import build_providers
+from router_finder import RouteFinder
+from token_cache import TokenCache
+from tx_watchdog import TxWatchdog
+from block_dispatch import BlockDispatcher, Wave
+from results_sink import ResultsSink, TradeRecord, fill_from_receipt, results_filename
 
 # 加载环境变量
 load_dotenv()
 
 # 连接到 BSC
 BSC_RPC = "https://bsc-dataseed.binance.org/"
-w3 = Web3(Web3.HTTPProvider(BSC_RPC))
-w3_async = AsyncWeb3(AsyncWeb3.AsyncHTTPProvider(BSC_RPC))
+# 通过 RPC_MODE=record|replay 录制或回放 JSON-RPC 流量
+provider, async_provider = build_providers(BSC_RPC)
+w3 = Web3(provider)
+w3_async = AsyncWeb3(async_provider)
+# 卡住的交易按区块数自动提价重发
+watchdog = TxWatchdog(w3_async)
+# 代币精度和买卖税缓存
+token_cache = TokenCache()
 
 # 合约地址
 PANCAKE_ROUTER = "0x10ED43C718714eb63d5aA57B78B54704E256024E"
 WBNB = "0xbb4CdB9CBd36B01bD1cBaEBF2De08d9173bc095c"
 TOKEN = "0xF3c7CECF8cBC3066F9a87b310cEBE198d00479aC"
 
+# 在代币实际买入税之外额外允许的滑点
+SLIPPAGE = 0.05
+
 def load_wallets(filename: str) -> List[Dict]:
     """加载钱包文件"""
     with open(filename, 'r') as f:
         return json.load(f)
 
-async def get_token_price(router_contract) -> tuple:
+async def find_path(amount_in: int) -> List[str]:
+    """在本地池子索引中查找输出最多的 V2 路径（经 USDT/BUSD 等中转），找不到时使用直连路径"""
+    finder = RouteFinder()
+    await finder.build(w3_async, [TOKEN], include_v3=False)
+    route, _ = finder.best_route(WBNB, TOKEN, amount_in, v2_only=True)
+    return route.v2_path() if route is not None else [WBNB, TOKEN]
+
+async def get_token_price(router_contract, path: List[str]) -> tuple:
     """获取代币价格"""
     amount_in = w3.to_wei(0.01, 'ether')
-    path = [WBNB, TOKEN]
     
     try:
         amounts_out = await router_contract.functions.getAmountsOut(
             amount_in,
             path
         ).call()
-        return True, amounts_out[1]
+        return True, amounts_out[-1]
     except Exception as e:
         return False, str(e)
 
-async def execute_swap(wallet: Dict, router_contract, amount_out_min: int):
-    """执行单个钱包的交易"""
+async def execute_swap(wallet: Dict, router_contract, path: List[str], amount_out_min: int, sink: ResultsSink,
+                       expected_out: int = 0, wave: Optional[Wave] = None) -> bool:
+    """执行单个钱包的交易，结果写入 sink"""
+    record = TradeRecord(wallet['index'], wallet.get('address', ''))
+    record.expected_out = expected_out
     try:
         account = w3.eth.account.from_key(wallet['private_key'])
+        record.wallet = account.address
         amount_in = w3.to_wei(0.01, 'ether')
-        path = [WBNB, TOKEN]
+        record.bnb_in = amount_in
         deadline = int((datetime.now() + timedelta(minutes=20)).timestamp())
         
         # 构建交易
+        start = time.perf_counter()
         transaction = await router_contract.functions.swapExactETHForTokensSupportingFeeOnTransferTokens(
             amount_out_min,
             path,
@@ -59,29 +88,49 @@ async def execute_swap(wallet: Dict, router_contract, amount_out_min: int):
             'gasPrice': await w3_async.eth.gas_price,
             'nonce': await w3_async.eth.get_transaction_count(account.address),
         })
+        record.t_build = time.perf_counter() - start
         
-        # 签名并发送交易
-        signed_txn = w3.eth.account.sign_transaction(transaction, wallet['private_key'])
-        tx_hash = await w3_async.eth.send_raw_transaction(signed_txn.rawTransaction)
+        # 签名并发送交易（由看门狗跟踪）；批次模式下等整批到齐后按区块对齐广播
+        start = time.perf_counter()
+        if wave is not None:
+            tx_hash = await wave.send(transaction, wallet['private_key'])
+        else:
+            tx_hash = await watchdog.send(transaction, wallet['private_key'])
+        record.t_send = time.perf_counter() - start
+        record.tx_hash = tx_hash.hex()
         
         print(f"钱包 {wallet['index']} 交易已发送: {tx_hash.hex()}")
         
-        # 等待交易确认
-        receipt = await w3_async.eth.wait_for_transaction_receipt(tx_hash)
+        # 等待交易确认（卡住时自动提价重发，返回最终上链版本的收据）
+        start = time.perf_counter()
+        receipt = await watchdog.wait(tx_hash)
+        record.t_confirm = time.perf_counter() - start
+        fill_from_receipt(record, receipt, TOKEN, transaction['gasPrice'])
         
         if receipt['status'] == 1:
             print(f"钱包 {wallet['index']} 交易成功! Gas used: {receipt['gasUsed']}")
-            return True, receipt
         else:
             print(f"钱包 {wallet['index']} 交易失败!")
-            return False, receipt
             
     except Exception as e:
         print(f"钱包 {wallet['index']} 交易错误: {str(e)}")
-        return False, str(e)
+        record.error = str(e)
+        if wave is not None:
+            wave.skip()
+
+    sink.add(record)
+    return record.status == 1
 
 async def main():
+    sink = None
+    dispatcher = None
     try:
+        # 设置命令行参数
+        parser = argparse.ArgumentParser(description='PancakeSwap V2 批量钱包交易')
+        parser.add_argument('--wave', action='store_true',
+                            help='剩余钱包的交易预先签名，在新区块出现后整批广播')
+        args = parser.parse_args()
+
         # 加载 Router 合约 ABI
         with open('abis/pancake_v2.json', 'r') as f:
             ROUTER_ABI = json.load(f)
@@ -96,16 +145,24 @@ async def main():
         wallets = load_wallets('wallets/wallets_20241201_044109.json')
         print(f"已加载 {len(wallets)} 个钱包")
         
-        # 查询价格
+        # 查找最优路径并查询价格
+        print("\n查找最优路径...")
+        path = await find_path(w3.to_wei(0.01, 'ether'))
+        print(f"交易路径: {' -> '.join(path)}")
+        
         print("\n查询代币价格...")
-        success, price_result = await get_token_price(router_contract)
+        success, price_result = await get_token_price(router_contract, path)
         
         if not success:
             print(f"获取价格失败: {price_result}")
             return
             
-        amount_out_min = int(price_result * 0.95)  # 设置 5% 滑点
+        # 按代币实际买入税 + 滑点计算最小到账数量（缓存有效时不访问网络）
+        await token_cache.refresh(w3_async, [TOKEN], PANCAKE_ROUTER, WBNB)
+        expected_out = token_cache.expected_out(TOKEN, price_result)
+        amount_out_min = token_cache.min_amount_out(TOKEN, price_result, SLIPPAGE)
         print(f"0.01 BNB 可以换取: {w3.from_wei(price_result, 'ether')} 代币")
+        print(f"买入税: {token_cache.buy_tax(TOKEN):.2%}, 卖出税: {token_cache.sell_tax(TOKEN):.2%}")
         
         # 询问是否开始测试交易
         response = input("\n是否开始测试交易（使用第一个钱包）? (y/n): ")
@@ -113,11 +170,14 @@ async def main():
             print("交易已取消")
             return
         
+        # 执行结果流式写入文件
+        sink = ResultsSink(results_filename('batch_pancakev2'))
+        
         # 先测试第一个钱包
         print("\n开始测试交易...")
-        test_result = await execute_swap(wallets[0], router_contract, amount_out_min)
+        test_result = await execute_swap(wallets[0], router_contract, path, amount_out_min, sink, expected_out)
         
-        if not test_result[0]:
+        if not test_result:
             print("\n测试交易失败，建议检查后再尝试批量交易")
             return
             
@@ -132,36 +192,31 @@ async def main():
         # 创建剩余钱包的交易任务
         print("\n开始执行剩余钱包交易...")
         remaining_wallets = wallets[1:]  # 跳过第一个钱包
+        wave = None
+        if args.wave:
+            dispatcher = BlockDispatcher(w3_async, watchdog, BSC_RPC)
+            wave = Wave(dispatcher, len(remaining_wallets))
         tasks = [
-            execute_swap(wallet, router_contract, amount_out_min)
+            execute_swap(wallet, router_contract, path, amount_out_min, sink, expected_out, wave=wave)
             for wallet in remaining_wallets
         ]
         
         # 同时执行所有交易
-        results = await asyncio.gather(*tasks, return_exceptions=True)
-        
-        # 将测试交易的结果加入到总结果中
-        all_results = [test_result] + list(results)
+        await asyncio.gather(*tasks, return_exceptions=True)
         
         # 统计结果
-        success_count = sum(1 for result in all_results if isinstance(result, tuple) and result[0])
-        fail_count = len(all_results) - success_count
-        
         print("\n交易统计:")
-        print(f"成功: {success_count}")
-        print(f"失败: {fail_count}")
-        
-        # 显示详细结果
-        print("\n详细结果:")
-        for wallet, result in zip(wallets, all_results):
-            if isinstance(result, tuple):
-                status = "成功" if result[0] else "失败"
-                print(f"钱包 {wallet['index']}: {status}")
-            else:
-                print(f"钱包 {wallet['index']}: 错误 - {str(result)}")
+        print(f"成功: {sink.success_count}")
+        print(f"失败: {sink.fail_count}")
+        print(f"\n详细结果已写入: {sink.filename}")
         
     except Exception as e:
         print(f"发生错误: {str(e)}")
+    finally:
+        if dispatcher is not None:
+            await dispatcher.close()
+        if sink is not None:
+            sink.close()
 
 if __name__ == "__main__":
     asyncio.run(main()) 
\ No newline at end of file
@@ -4,15 +4,26 @@ from datetime import datetime, timedelta
 import os
 from dotenv import load_dotenv
 import asyncio
-from typing import List, Dict
+import time
+from typing import List, Dict, Optional
+import argparse
+
+from rpc_cassette import build_providers
+from tx_watchdog import TxWatchdog
+from block_dispatch import BlockDispatcher, Wave
+from results_sink import ResultsSink, TradeRecord, fill_from_receipt, results_filename
 
 # 加载环境变量
 load_dotenv()
 
 # 连接到 BSC
 BSC_RPC = "https://bsc-dataseed.binance.org/"
-w3 = Web3(Web3.HTTPProvider(BSC_RPC))
-w3_async = AsyncWeb3(AsyncWeb3.AsyncHTTPProvider(BSC_RPC))
+# 通过 RPC_MODE=record|replay 录制或回放 JSON-RPC 流量
+provider, async_provider = build_providers(BSC_RPC)
+w3 = Web3(provider)
+w3_async = AsyncWeb3(async_provider)
+# 卡住的交易按区块数自动提价重发
+watchdog = TxWatchdog(w3_async)
 
 # 合约地址
 UNIVERSAL_ROUTER_ADDRESS = w3.to_checksum_address("0x1a0a18ac4becddbd6389559687d1a73d8927e416")
@@ -22,12 +33,18 @@ def load_wallets(filename: str) -> List[Dict]:
     with open(filename, 'r') as f:
         return json.load(f)
 
-async def execute_trade(wallet: Dict, router_contract, commands: bytes, inputs: List[bytes], deadline: int):
-    """执行单个钱包的交易"""
+async def execute_trade(wallet: Dict, router_contract, commands: bytes, inputs: List[bytes], deadline: int,
+                        sink: ResultsSink, wave: Optional[Wave] = None) -> bool:
+    """执行单个钱包的交易，结果写入 sink"""
+    record = TradeRecord(wallet['index'], wallet.get('address', ''))
     try:
         account = w3.eth.account.from_key(wallet['private_key'])
+        record.wallet = account.address
+        # V2 路径的最后一个地址即买入的代币
+        token = w3.to_checksum_address(inputs[1][-20:])
         
         # 检查 BNB 余额
+        start = time.perf_counter()
         balance = await w3_async.eth.get_balance(account.address)
         bnb_balance = w3.from_wei(balance, 'ether')
         required_bnb = 0.01
@@ -38,7 +55,11 @@ async def execute_trade(wallet: Dict, router_contract, commands: bytes, inputs:
         
         if balance < w3.to_wei(required_bnb, 'ether'):
             print(f"钱包 {wallet['index']} BNB 余额不足!")
-            return False, "余额不足"
+            record.error = "余额不足"
+            if wave is not None:
+                wave.skip()
+            sink.add(record)
+            return False
         
         # 修改 inputs 中的接收地址为当前钱包地址
         modified_inputs = [
@@ -62,28 +83,49 @@ async def execute_trade(wallet: Dict, router_contract, commands: bytes, inputs:
             'nonce': await w3_async.eth.get_transaction_count(account.address),
             'value': w3.to_wei(0.01, 'ether')
         })
+        record.bnb_in = transaction['value']
+        record.t_build = time.perf_counter() - start
         
-        # 签名并发送交易
-        signed_txn = w3.eth.account.sign_transaction(transaction, wallet['private_key'])
-        tx_hash = await w3_async.eth.send_raw_transaction(signed_txn.rawTransaction)
+        # 签名并发送交易（由看门狗跟踪）；批次模式下等整批到齐后按区块对齐广播
+        start = time.perf_counter()
+        if wave is not None:
+            tx_hash = await wave.send(transaction, wallet['private_key'])
+        else:
+            tx_hash = await watchdog.send(transaction, wallet['private_key'])
+        record.t_send = time.perf_counter() - start
+        record.tx_hash = tx_hash.hex()
         print(f"钱包 {wallet['index']} 交易已发送: {tx_hash.hex()}")
         
-        # 等待交易确认
-        receipt = await w3_async.eth.wait_for_transaction_receipt(tx_hash)
+        # 等待交易确认（卡住时自动提价重发，返回最终上链版本的收据）
+        start = time.perf_counter()
+        receipt = await watchdog.wait(tx_hash)
+        record.t_confirm = time.perf_counter() - start
+        fill_from_receipt(record, receipt, token, transaction['gasPrice'])
         
         if receipt['status'] == 1:
             print(f"钱包 {wallet['index']} 交易成功!")
-            return True, receipt
         else:
             print(f"钱包 {wallet['index']} 交易失败!")
-            return False, receipt
             
     except Exception as e:
         print(f"钱包 {wallet['index']} 交易错误: {str(e)}")
-        return False, str(e)
+        record.error = str(e)
+        if wave is not None:
+            wave.skip()
+
+    sink.add(record)
+    return record.status == 1
 
 async def main():
+    sink = None
+    dispatcher = None
     try:
+        # 设置命令行参数
+        parser = argparse.ArgumentParser(description='Universal Router 批量钱包交易')
+        parser.add_argument('--wave', action='store_true',
+                            help='剩余钱包的交易预先签名，在新区块出现后整批广播')
+        args = parser.parse_args()
+
         # 加载 Router ABI
         with open('abis/pancake_universal_router.json', 'r') as f:
             ROUTER_ABI = json.load(f)
@@ -106,11 +148,14 @@ async def main():
         ]
         deadline = int((datetime.now() + timedelta(minutes=20)).timestamp())
         
+        # 执行结果流式写入文件
+        sink = ResultsSink(results_filename('batch_universal_router'))
+        
         # 先测试第一个钱包
         print("\n开始测试交易...")
-        test_result = await execute_trade(wallets[0], router_contract, commands, inputs, deadline)
+        test_result = await execute_trade(wallets[0], router_contract, commands, inputs, deadline, sink)
         
-        if not test_result[0]:
+        if not test_result:
             print("\n测试交易失败，建议检查后再尝试批量交易")
             return
             
@@ -125,36 +170,31 @@ async def main():
         # 创建剩余钱包的交易任务
         print("\n开始执行剩余钱包交易...")
         remaining_wallets = wallets[1:]
+        wave = None
+        if args.wave:
+            dispatcher = BlockDispatcher(w3_async, watchdog, BSC_RPC)
+            wave = Wave(dispatcher, len(remaining_wallets))
         tasks = [
-            execute_trade(wallet, router_contract, commands, inputs, deadline)
+            execute_trade(wallet, router_contract, commands, inputs, deadline, sink, wave=wave)
             for wallet in remaining_wallets
         ]
         
         # 同时执行所有交易
-        results = await asyncio.gather(*tasks, return_exceptions=True)
-        
-        # 将测试交易的结果加入到总结果中
-        all_results = [test_result] + list(results)
+        await asyncio.gather(*tasks, return_exceptions=True)
         
         # 统计结果
-        success_count = sum(1 for result in all_results if isinstance(result, tuple) and result[0])
-        fail_count = len(all_results) - success_count
-        
         print("\n交易统计:")
-        print(f"成功: {success_count}")
-        print(f"失败: {fail_count}")
-        
-        # 显示详细结果
-        print("\n详细结果:")
-        for wallet, result in zip(wallets, all_results):
-            if isinstance(result, tuple):
-                status = "成功" if result[0] else "失败"
-                print(f"钱包 {wallet['index']}: {status}")
-            else:
-                print(f"钱包 {wallet['index']}: 错误 - {str(result)}")
+        print(f"成功: {sink.success_count}")
+        print(f"失败: {sink.fail_count}")
+        print(f"\n详细结果已写入: {sink.filename}")
         
     except Exception as e:
         print(f"发生错误: {str(e)}")
+    finally:
+        if dispatcher is not None:
+            await dispatcher.close()
+        if sink is not None:
+            sink.close()
 
 if __name__ == "__main__":
     asyncio.run(main()) 
\ No newline at end of file
@@ -0,0 +1,250 @@
+import asyncio
+import json
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+from tx_watchdog import TxWatchdog
+
+# 各 RPC 节点的学习状态（广播延迟、出块间隔、安全余量、上链区块数分布）
+DISPATCH_STATE_FILE = "cache/dispatch.json"
+
+# EWMA 平滑系数
+EWMA_ALPHA = 0.2
+# 初始广播延迟和安全余量（秒）
+DEFAULT_LATENCY = 0.3
+DEFAULT_MARGIN = 0.2
+MIN_MARGIN = 0.05
+MAX_MARGIN = 2.0
+# 整批落在下一个区块时余量按比例收缩，有交易晚于下一个区块时按步长放大
+MARGIN_DECAY = 0.9
+MARGIN_STEP = 0.1
+# 没有历史数据时，用最近多少个区块的时间戳估算出块间隔
+INTERVAL_SAMPLE_BLOCKS = 100
+DEFAULT_BLOCK_INTERVAL = 3.0
+# 预测的出块时间之前多久开始高频轮询，以及轮询间隔（秒）
+HEAD_POLL_LEAD = 0.3
+HEAD_POLL_INTERVAL = 0.05
+# 时间不足时最多顺延的区块数
+MAX_SKIPPED_HEADS = 2
+
+
+def ewma(old: Optional[float], new: float, alpha: float = EWMA_ALPHA) -> float:
+    return new if old is None else old + alpha * (new - old)
+
+
+class EndpointStats:
+    """单个 RPC 节点的学习状态"""
+
+    def __init__(self, data: Optional[Dict] = None):
+        data = data or {}
+        self.latency: float = data.get('latency', DEFAULT_LATENCY)
+        self.block_interval: Optional[float] = data.get('block_interval')
+        self.margin: float = data.get('margin', DEFAULT_MARGIN)
+        # 上链所用区块数 -> 交易笔数
+        self.inclusion: Dict[int, int] = {int(k): v for k, v in data.get('inclusion', {}).items()}
+
+    def to_dict(self) -> Dict:
+        return {
+            'latency': self.latency,
+            'block_interval': self.block_interval,
+            'margin': self.margin,
+            'inclusion': {str(k): v for k, v in sorted(self.inclusion.items())},
+        }
+
+
+class BlockDispatcher:
+    """
+    按区块对齐的批量广播
+    预先签好一批交易，看到新区块后立即同时广播，争取整批落在下一个区块；
+    根据学到的广播延迟和出块间隔判断时间是否来得及，来不及就顺延到下一个区块。
+    每笔交易上链所用的区块数会被记录下来，用于自动调整安全余量
+    """
+
+    def __init__(self, w3_async, watchdog: TxWatchdog, endpoint: str, state_file: str = DISPATCH_STATE_FILE):
+        self.w3_async = w3_async
+        self.watchdog = watchdog
+        self.endpoint = endpoint
+        self.state_file = state_file
+        self._state = self._load()
+        self.stats = EndpointStats(self._state.get(endpoint))
+        self._head: Optional[int] = None
+        # 当前区块的（估计）出块时间，用于计算距下一个区块还剩多少时间
+        self._head_time = 0.0
+        # 实际看到当前区块的时间，用于学习出块间隔
+        self._seen_time = 0.0
+        # 上一个区块的到达时间是否是实际观测到的（而不是启动时读取的）
+        self._head_observed = False
+        self._tasks: List[asyncio.Task] = []
+
+    def _load(self) -> Dict:
+        if os.path.exists(self.state_file):
+            with open(self.state_file, 'r') as f:
+                return json.load(f)
+        return {}
+
+    def save(self):
+        self._state[self.endpoint] = self.stats.to_dict()
+        os.makedirs(os.path.dirname(self.state_file), exist_ok=True)
+        with open(self.state_file, 'w') as f:
+            json.dump(self._state, f, indent=4)
+
+    async def _init_block_interval(self):
+        """首次使用时用最近区块的时间戳估算出块间隔"""
+        if self.stats.block_interval is not None:
+            return
+        latest = await self.w3_async.eth.get_block('latest')
+        # 新链（如本地开发链）的区块数可能不足采样窗口
+        samples = min(INTERVAL_SAMPLE_BLOCKS, latest['number'])
+        if samples <= 0:
+            self.stats.block_interval = DEFAULT_BLOCK_INTERVAL
+            return
+        past = await self.w3_async.eth.get_block(latest['number'] - samples)
+        interval = (latest['timestamp'] - past['timestamp']) / samples
+        self.stats.block_interval = interval if interval > 0 else DEFAULT_BLOCK_INTERVAL
+
+    async def wait_for_head(self) -> int:
+        """等待下一个新区块，按预测的出块时间休眠，临近时才高频轮询"""
+        if self._head is None:
+            self._head = await self.w3_async.eth.block_number
+            self._head_time = self._seen_time = time.monotonic()
+        elif self._head_observed:
+            delay = self._head_time + self.stats.block_interval - HEAD_POLL_LEAD - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+        # 最后一次还没看到新区块的轮询时间，新区块一定在这之后产出
+        missed = None
+        while True:
+            polled = time.monotonic()
+            block_number = await self.w3_async.eth.block_number
+            now = time.monotonic()
+            if block_number > self._head:
+                break
+            missed = polled
+            await asyncio.sleep(HEAD_POLL_INTERVAL)
+
+        head_time = now if missed is None else missed
+        if self._head_observed and block_number == self._head + 1:
+            self.stats.block_interval = ewma(self.stats.block_interval, now - self._seen_time)
+            # 看到新区块总是晚于实际出块（轮询间隔 + RPC 延迟），以预测的出块时间为准，
+            # 但不早于最后一次未命中的轮询，避免预测误差逐块累积
+            head_time = min(now, self._head_time + self.stats.block_interval)
+            if missed is not None:
+                head_time = max(head_time, missed)
+        self._head, self._head_time, self._seen_time = block_number, head_time, now
+        self._head_observed = True
+        return block_number
+
+    async def _release_point(self) -> int:
+        """等到一个来得及把整批交易送进下一个区块的新区块，返回该区块号"""
+        for _ in range(MAX_SKIPPED_HEADS + 1):
+            head = await self.wait_for_head()
+            remaining = self.stats.block_interval - (time.monotonic() - self._head_time) - self.stats.latency
+            if remaining >= self.stats.margin:
+                break
+            print(f"区块 {head} 后剩余时间不足 ({remaining:.2f}s)，顺延到下一个区块")
+        return head
+
+    async def dispatch(self, items: List[Tuple[Dict, str]]) -> List:
+        """
+        预签名并按区块对齐广播一批 (交易, 私钥)
+        返回与 items 一一对应的交易哈希，广播失败的位置是异常对象
+        """
+        await self._init_block_interval()
+        signed = [self.w3_async.eth.account.sign_transaction(tx, pk).raw_transaction for tx, pk in items]
+
+        head = await self._release_point()
+
+        async def broadcast(item: Tuple[Dict, str], raw_transaction: bytes):
+            start = time.perf_counter()
+            tx_hash = await self.watchdog.send_signed(item[0], item[1], raw_transaction, head)
+            return tx_hash, time.perf_counter() - start
+
+        results = await asyncio.gather(*[
+            broadcast(item, raw) for item, raw in zip(items, signed)
+        ], return_exceptions=True)
+
+        sent = [r for r in results if not isinstance(r, BaseException)]
+        if sent:
+            # 整批的有效延迟取决于最慢的一笔
+            self.stats.latency = ewma(self.stats.latency, max(latency for _, latency in sent))
+            futures = [self.watchdog.future(tx_hash) for tx_hash, _ in sent]
+            self._tasks.append(asyncio.create_task(self._record_inclusion(head, futures)))
+        print(f"区块 {head} 后广播 {len(sent)}/{len(items)} 笔交易")
+
+        return [r if isinstance(r, BaseException) else r[0] for r in results]
+
+    async def _record_inclusion(self, head: int, futures: List[asyncio.Future]):
+        """记录每笔交易上链用了几个区块，并据此调整安全余量"""
+        receipts = await asyncio.gather(*futures, return_exceptions=True)
+        delays = [r['blockNumber'] - head for r in receipts if not isinstance(r, BaseException)]
+        if not delays:
+            return
+
+        for delay in delays:
+            self.stats.inclusion[delay] = self.stats.inclusion.get(delay, 0) + 1
+        if max(delays) > 1:
+            self.stats.margin = min(self.stats.margin + MARGIN_STEP, MAX_MARGIN)
+        else:
+            self.stats.margin = max(self.stats.margin * MARGIN_DECAY, MIN_MARGIN)
+
+        blocks = len(set(delays))
+        print(f"区块 {head} 的批次落在 {blocks} 个区块内, 最多延后 {max(delays)} 个区块 "
+              f"(延迟 {self.stats.latency:.3f}s, 出块间隔 {self.stats.block_interval:.2f}s, "
+              f"余量 {self.stats.margin:.2f}s)")
+        self.save()
+
+    async def close(self):
+        """等待上链统计完成并保存状态"""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+            self._tasks.clear()
+        self.save()
+
+
+class Wave:
+    """
+    收集一批交易，全部到齐后交给 BlockDispatcher 一次性广播
+    在广播前就失败的参与者需要调用 skip()，避免整批一直等待
+    """
+
+    def __init__(self, dispatcher: BlockDispatcher, size: int):
+        self.dispatcher = dispatcher
+        self.size = size
+        self._items: List[Tuple[Dict, str]] = []
+        self._futures: List[asyncio.Future] = []
+        self._released = False
+        self._task: Optional[asyncio.Task] = None
+
+    async def send(self, transaction: Dict, private_key: str) -> bytes:
+        """加入批次，整批广播后返回本笔交易的哈希"""
+        future = asyncio.get_running_loop().create_future()
+        self._items.append((transaction, private_key))
+        self._futures.append(future)
+        self._maybe_release()
+        return await future
+
+    def skip(self):
+        """一个参与者不再发送交易（批次已广播后调用无效果）"""
+        if not self._released:
+            self.size -= 1
+            self._maybe_release()
+
+    def _maybe_release(self):
+        if self._released or len(self._items) < self.size:
+            return
+        self._released = True
+        if self._items:
+            self._task = asyncio.create_task(self._release())
+
+    async def _release(self):
+        try:
+            results = await self.dispatcher.dispatch(self._items)
+        except Exception as e:
+            results = [e] * len(self._futures)
+        for future, result in zip(self._futures, results):
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
@@ -0,0 +1,251 @@
+from web3 import Web3, AsyncWeb3
+import json
+from datetime import datetime, timedelta
+import os
+from dotenv import load_dotenv
+import asyncio
+import time
+from typing import List, Dict, Optional
+import argparse
+
+from multicall import encode_call
+from results_sink import ResultsSink, TradeRecord, fill_from_receipt, results_filename
+from router_finder import RouteFinder, encode_universal_router, WBNB
+from rpc_cassette import build_providers
+from token_cache import TokenCache
+from tx_state import NonceManager, GasOracle
+from tx_watchdog import TxWatchdog
+
+# 加载环境变量
+load_dotenv()
+
+# 连接到 BSC
+BSC_RPC = os.getenv("BSC_RPC", "https://bsc-dataseed.binance.org/")
+provider, async_provider = build_providers(BSC_RPC)
+w3 = Web3(provider)
+w3_async = AsyncWeb3(async_provider)
+
+# 合约地址
+PANCAKE_ROUTER = "0x10ED43C718714eb63d5aA57B78B54704E256024E"
+UNIVERSAL_ROUTER_ADDRESS = Web3.to_checksum_address("0x1a0a18ac4becddbd6389559687d1a73d8927e416")
+
+# 默认 gas 上限
+ROUTER_GAS = {'v2': 300000, 'universal': 366321}
+
+# 配置文件格式（JSON）:
+# {
+#     "campaigns": [
+#         {
+#             "name": "coco-v2",
+#             "token": "0x...",
+#             "router": "v2",                    # v2 或 universal
+#             "wallets": "wallets/wallets_20241201_044109.json",
+#             "wallet_indices": [1, 2, 3],       # 可选，默认使用文件中全部钱包
+#             "amount_bnb": 0.01,
+#             "interval": 30,                    # 每轮间隔（秒）
+#             "rounds": 1,
+#             "slippage": {"mode": "tax_aware", "value": 0.05}   # 或 {"mode": "flat", "value": 0.05}
+#         }
+#     ]
+# }
+
+
+class CampaignContext:
+    """所有活动共享的连接、nonce、gas、路由和结果写入"""
+
+    def __init__(self, w3_async, sink: ResultsSink):
+        self.w3_async = w3_async
+        self.nonces = NonceManager(w3_async)
+        self.gas = GasOracle(w3_async)
+        self.watchdog = TxWatchdog(w3_async)
+        self.finder = RouteFinder()
+        self.token_cache = TokenCache()
+        self.sink = sink
+        self.chain_id: Optional[int] = None
+        self._wallet_files: Dict[str, List[Dict]] = {}
+        self._refresh_lock = asyncio.Lock()
+        self._refreshed_at = 0.0
+
+    def wallets(self, filename: str) -> List[Dict]:
+        """加载钱包文件（同一文件只读取一次）"""
+        if filename not in self._wallet_files:
+            with open(filename, 'r') as f:
+                self._wallet_files[filename] = json.load(f)
+        return self._wallet_files[filename]
+
+    async def refresh_reserves(self, max_age: float = 1.0):
+        """刷新储备量，多个活动同时请求时只刷新一次"""
+        async with self._refresh_lock:
+            if time.monotonic() - self._refreshed_at > max_age:
+                await self.finder.refresh_reserves(self.w3_async)
+                self._refreshed_at = time.monotonic()
+
+
+class Campaign:
+    """一个代币 / 路由 / 钱包子集的交易活动"""
+
+    def __init__(self, config: Dict, ctx: CampaignContext):
+        self.name = config.get('name', config['token'])
+        self.token = Web3.to_checksum_address(config['token'])
+        self.router = config.get('router', 'v2')
+        if self.router not in ROUTER_GAS:
+            raise Exception(f"活动 {self.name}: 不支持的路由类型 {self.router}")
+        self.amount_in = Web3.to_wei(config.get('amount_bnb', 0.01), 'ether')
+        self.interval = config.get('interval', 0)
+        self.rounds = config.get('rounds', 1)
+        self.slippage = config.get('slippage', {'mode': 'tax_aware', 'value': 0.05})
+        self.gas = config.get('gas', ROUTER_GAS[self.router])
+        self.ctx = ctx
+
+        wallets = ctx.wallets(config['wallets'])
+        indices = config.get('wallet_indices')
+        self.wallets = [w for w in wallets if indices is None or w['index'] in indices]
+
+    def min_amount_out(self, quoted: int) -> int:
+        """按滑点策略计算最小到账数量"""
+        if self.slippage.get('mode') == 'flat':
+            return int(quoted * (1 - self.slippage['value']))
+        return self.ctx.token_cache.min_amount_out(self.token, quoted, self.slippage['value'])
+
+    def expected_out(self, quoted: int) -> int:
+        """预期到账数量，只有按税率计算滑点时才扣除买入税"""
+        if self.slippage.get('mode') == 'flat':
+            return quoted
+        return self.ctx.token_cache.expected_out(self.token, quoted)
+
+    def build_call(self, recipient: str) -> Dict:
+        """按当前缓存的储备量选路并生成交易的 to / data / 预期输出"""
+        deadline = int((datetime.now() + timedelta(minutes=20)).timestamp())
+
+        if self.router == 'v2':
+            route, quoted = self.ctx.finder.best_route(WBNB, self.token, self.amount_in, v2_only=True)
+            if route is None:
+                raise Exception("未找到 V2 路径")
+            data = encode_call(
+                "swapExactETHForTokensSupportingFeeOnTransferTokens(uint256,address[],address,uint256)",
+                [self.min_amount_out(quoted), route.v2_path(), recipient, deadline]
+            )
+            return {'to': PANCAKE_ROUTER, 'data': data, 'expected': quoted}
+
+        legs, quoted = self.ctx.finder.best_split(WBNB, self.token, self.amount_in)
+        if not legs:
+            raise Exception("未找到路径")
+        # 按策略把每条腿的最小输出折算成整体滑点
+        slippage = 1 - self.min_amount_out(quoted) / quoted if quoted else 0
+        commands, inputs = encode_universal_router(legs, recipient, slippage)
+        data = encode_call("execute(bytes,bytes[],uint256)", [commands, inputs, deadline])
+        return {'to': UNIVERSAL_ROUTER_ADDRESS, 'data': data, 'expected': quoted}
+
+    async def trade(self, wallet: Dict) -> bool:
+        """单个钱包执行一次交易"""
+        ctx = self.ctx
+        record = TradeRecord(wallet['index'], wallet.get('address', ''))
+        record.bnb_in = self.amount_in
+        try:
+            account = w3.eth.account.from_key(wallet['private_key'])
+            record.wallet = account.address
+            start = time.perf_counter()
+            call = self.build_call(account.address)
+            record.expected_out = self.expected_out(call['expected'])
+            gas_price = await ctx.gas.gas_price()
+
+            # nonce 在其他准备工作都成功后才分配，广播前任何失败都丢弃本地计数，避免留下空洞
+            nonce = await ctx.nonces.next(account.address)
+            try:
+                transaction = {
+                    'from': account.address,
+                    'to': call['to'],
+                    'data': call['data'],
+                    'value': self.amount_in,
+                    'gas': self.gas,
+                    'gasPrice': gas_price,
+                    'nonce': nonce,
+                    'chainId': ctx.chain_id,
+                }
+                record.t_build = time.perf_counter() - start
+
+                start = time.perf_counter()
+                tx_hash = await ctx.watchdog.send(transaction, wallet['private_key'])
+            except BaseException:
+                ctx.nonces.reset(account.address)
+                raise
+            record.t_send = time.perf_counter() - start
+            record.tx_hash = tx_hash.hex()
+            print(f"[{self.name}] 钱包 {wallet['index']} 交易已发送: {tx_hash.hex()}")
+
+            start = time.perf_counter()
+            receipt = await ctx.watchdog.wait(tx_hash)
+            record.t_confirm = time.perf_counter() - start
+            fill_from_receipt(record, receipt, self.token, gas_price)
+            status = "成功" if receipt['status'] == 1 else "失败"
+            print(f"[{self.name}] 钱包 {wallet['index']} 交易{status}")
+
+        except Exception as e:
+            print(f"[{self.name}] 钱包 {wallet['index']} 交易错误: {str(e)}")
+            record.error = str(e)
+
+        ctx.sink.add(record)
+        return record.status == 1
+
+    async def run(self):
+        """按轮次执行，每轮所有钱包并发"""
+        for round_index in range(self.rounds):
+            if round_index > 0 and self.interval:
+                await asyncio.sleep(self.interval)
+            await self.ctx.refresh_reserves()
+            results = await asyncio.gather(*[self.trade(wallet) for wallet in self.wallets])
+            print(f"[{self.name}] 第 {round_index + 1}/{self.rounds} 轮完成: "
+                  f"成功 {sum(results)}, 失败 {len(results) - sum(results)}")
+
+
+async def run_campaigns(config: Dict, sink: ResultsSink):
+    """在同一个事件循环中并发运行所有活动"""
+    ctx = CampaignContext(w3_async, sink)
+    campaigns = [Campaign(c, ctx) for c in config['campaigns']]
+    tokens = sorted({c.token for c in campaigns})
+    include_v3 = any(c.router == 'universal' for c in campaigns)
+
+    ctx.chain_id, _, _ = await asyncio.gather(
+        w3_async.eth.chain_id,
+        ctx.finder.build(w3_async, tokens, include_v3=include_v3),
+        ctx.token_cache.refresh(w3_async, tokens),
+    )
+
+    for campaign in campaigns:
+        print(f"活动 {campaign.name}: {campaign.router} 路由, {len(campaign.wallets)} 个钱包, "
+              f"{campaign.rounds} 轮, 每次 {w3.from_wei(campaign.amount_in, 'ether')} BNB")
+
+    start = time.perf_counter()
+    await asyncio.gather(*[campaign.run() for campaign in campaigns])
+    elapsed = time.perf_counter() - start
+    total = sink.success_count + sink.fail_count
+    print(f"\n全部完成: {total} 笔交易, 耗时 {elapsed:.1f}s, 吞吐 {total / elapsed if elapsed else 0:.2f} 笔/秒")
+
+
+async def main():
+    sink = None
+    try:
+        # 设置命令行参数
+        parser = argparse.ArgumentParser(description='按配置文件并发运行多个交易活动（无交互）')
+        parser.add_argument('config', help='活动配置文件（JSON）')
+        args = parser.parse_args()
+
+        with open(args.config, 'r') as f:
+            config = json.load(f)
+
+        sink = ResultsSink(results_filename('campaign'))
+        await run_campaigns(config, sink)
+
+        print("\n交易统计:")
+        print(f"成功: {sink.success_count}")
+        print(f"失败: {sink.fail_count}")
+        print(f"\n详细结果已写入: {sink.filename}")
+
+    except Exception as e:
+        print(f"发生错误: {str(e)}")
+    finally:
+        if sink is not None:
+            sink.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
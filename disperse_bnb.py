@@ -0,0 +1,330 @@
+from web3 import Web3, AsyncWeb3
+import json
+import os
+from dotenv import load_dotenv
+from eth_account import Account
+import time
+import asyncio
+from typing import List, Dict, Tuple, Optional
+import argparse
+
+from multicall import Call, aggregate, encode_call, eth_balance_call, token_balance_call
+from rpc_cassette import build_providers
+from solidity import compile_contract
+
+# 加载环境变量
+load_dotenv()
+
+# 连接到 BSC（可通过 BSC_RPC 指向本地开发链，例如 anvil --fork-url）
+BSC_RPC = os.getenv("BSC_RPC", "https://bsc-dataseed.binance.org/")
+provider, async_provider = build_providers(BSC_RPC)
+w3 = Web3(provider)
+w3_async = AsyncWeb3(async_provider)
+
+# Disperse.app 在主网及 BSC 上的部署地址，不存在时自动部署
+DISPERSE_ADDRESS = os.getenv("DISPERSE_ADDRESS", "0xD152f549545093347A162Dce210e7293f1452150")
+DEPLOYMENTS_FILE = "deployments/disperse.json"
+
+# 每个接收者的 gas 预估（新账户 25000 + 转账 9000 + 冷地址访问等）
+NATIVE_GAS_PER_RECIPIENT = 38000
+TOKEN_GAS_PER_RECIPIENT = 36000
+DISPERSE_BASE_GAS = 60000
+# 单笔交易最多占用区块 gas 上限的比例，保证能被及时打包
+BLOCK_GAS_FRACTION = 0.3
+
+DISPERSE_SOURCE = """
+// SPDX-License-Identifier: MIT
+pragma solidity ^0.8.0;
+
+interface IERC20 {
+    function transfer(address to, uint256 value) external returns (bool);
+    function transferFrom(address from, address to, uint256 value) external returns (bool);
+}
+
+contract Disperse {
+    function disperseEther(address[] calldata recipients, uint256[] calldata values) external payable {
+        for (uint256 i = 0; i < recipients.length; i++)
+            payable(recipients[i]).transfer(values[i]);
+        uint256 balance = address(this).balance;
+        if (balance > 0)
+            payable(msg.sender).transfer(balance);
+    }
+
+    function disperseToken(IERC20 token, address[] calldata recipients, uint256[] calldata values) external {
+        uint256 total = 0;
+        for (uint256 i = 0; i < recipients.length; i++)
+            total += values[i];
+        require(token.transferFrom(msg.sender, address(this), total));
+        for (uint256 i = 0; i < recipients.length; i++)
+            require(token.transfer(recipients[i], values[i]));
+    }
+}
+"""
+
+
+def load_wallets(filename: str) -> List[Dict]:
+    """加载钱包文件"""
+    with open(filename, 'r') as f:
+        return json.load(f)
+
+
+def load_deployments() -> Dict[str, str]:
+    """加载已部署的 Disperse 合约地址（按链 ID）"""
+    if not os.path.exists(DEPLOYMENTS_FILE):
+        return {}
+    with open(DEPLOYMENTS_FILE, 'r') as f:
+        return json.load(f)
+
+
+def save_deployment(chain_id: int, address: str):
+    """保存 Disperse 合约部署地址"""
+    deployments = load_deployments()
+    deployments[str(chain_id)] = address
+    os.makedirs(os.path.dirname(DEPLOYMENTS_FILE), exist_ok=True)
+    with open(DEPLOYMENTS_FILE, 'w') as f:
+        json.dump(deployments, f, indent=4)
+
+
+def chunk_size(block_gas_limit: int, gas_per_recipient: int) -> int:
+    """根据区块 gas 上限计算每笔交易最多包含的接收者数量"""
+    budget = int(block_gas_limit * BLOCK_GAS_FRACTION) - DISPERSE_BASE_GAS
+    return max(1, budget // gas_per_recipient)
+
+
+def split_chunks(items: List, size: int) -> List[List]:
+    """按固定大小切分列表"""
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+async def send_signed(account: Account, transaction: Dict) -> bytes:
+    """签名并广播交易"""
+    signed_txn = w3.eth.account.sign_transaction(transaction, account.key)
+    return await w3_async.eth.send_raw_transaction(signed_txn.raw_transaction)
+
+
+async def estimate_or_default(transaction: Dict, default_gas: int) -> int:
+    """预估 gas 并留 20% 余量，预估失败时使用默认值"""
+    try:
+        return int(await w3_async.eth.estimate_gas(transaction) * 1.2)
+    except Exception:
+        return default_gas
+
+
+async def ensure_disperse(account: Account, gas_price: int) -> str:
+    """返回可用的 Disperse 合约地址，链上不存在时自动部署"""
+    chain_id = await w3_async.eth.chain_id
+    candidates = [load_deployments().get(str(chain_id)), DISPERSE_ADDRESS]
+
+    for address in candidates:
+        if not address:
+            continue
+        address = w3.to_checksum_address(address)
+        code = await w3_async.eth.get_code(address)
+        if len(code) > 0:
+            return address
+
+    print("\n未找到 Disperse 合约，开始部署...")
+    artifact = compile_contract(DISPERSE_SOURCE, "Disperse")
+    transaction = {
+        'from': account.address,
+        'data': artifact['bytecode'],
+        'gasPrice': gas_price,
+        'nonce': await w3_async.eth.get_transaction_count(account.address),
+        'chainId': chain_id,
+    }
+    transaction['gas'] = await estimate_or_default(transaction, 500000)
+
+    tx_hash = await send_signed(account, transaction)
+    receipt = await w3_async.eth.wait_for_transaction_receipt(tx_hash)
+    if receipt['status'] != 1:
+        raise Exception(f"Disperse 合约部署失败: {tx_hash.hex()}")
+
+    address = receipt['contractAddress']
+    save_deployment(chain_id, address)
+    print(f"Disperse 合约已部署: {address}")
+    return address
+
+
+async def snapshot_balances(addresses: List[str], token_address: Optional[str]) -> List[Tuple[int, int]]:
+    """一次 multicall 读取所有地址的 BNB 和代币余额（wei）"""
+    calls = [eth_balance_call(addr) for addr in addresses]
+    if token_address:
+        calls += [token_balance_call(token_address, addr) for addr in addresses]
+
+    values = await aggregate(w3_async, calls)
+    bnb_balances = values[:len(addresses)]
+    token_balances = values[len(addresses):] if token_address else [0] * len(addresses)
+    return [(bnb or 0, token or 0) for bnb, token in zip(bnb_balances, token_balances)]
+
+
+async def disperse_funds(from_account: Account, to_addresses: List[str], amount_in_bnb: float,
+                         token_address: Optional[str] = None, token_amount: int = 0) -> List[Dict]:
+    """
+    通过 Disperse 合约批量分发 BNB（以及可选的代币）
+    接收者按区块 gas 上限切分成若干批，每批一笔交易
+    """
+    gas_price, latest_block, chain_id = await asyncio.gather(
+        w3_async.eth.gas_price,
+        w3_async.eth.get_block('latest'),
+        w3_async.eth.chain_id,
+    )
+    disperse = await ensure_disperse(from_account, gas_price)
+    nonce = await w3_async.eth.get_transaction_count(from_account.address)
+    amount_wei = w3.to_wei(amount_in_bnb, 'ether')
+    transactions = []
+
+    def base_tx(data: bytes, value: int = 0) -> Dict:
+        return {
+            'from': from_account.address,
+            'to': disperse,
+            'data': data,
+            'value': value,
+            'gasPrice': gas_price,
+            'chainId': chain_id,
+        }
+
+    # BNB 分发
+    if amount_wei > 0:
+        size = chunk_size(latest_block['gasLimit'], NATIVE_GAS_PER_RECIPIENT)
+        for chunk in split_chunks(to_addresses, size):
+            data = encode_call("disperseEther(address[],uint256[])", [chunk, [amount_wei] * len(chunk)])
+            transactions.append((base_tx(data, amount_wei * len(chunk)), NATIVE_GAS_PER_RECIPIENT * len(chunk)))
+
+    # 代币分发（需要先授权 Disperse 合约）
+    if token_address and token_amount > 0:
+        total = token_amount * len(to_addresses)
+        allowance = await w3_async.eth.call({
+            'to': token_address,
+            'data': encode_call("allowance(address,address)", [from_account.address, disperse]),
+        })
+        if int.from_bytes(allowance, 'big') < total:
+            approve = {
+                'from': from_account.address,
+                'to': token_address,
+                'data': encode_call("approve(address,uint256)", [disperse, total]),
+                'value': 0,
+                'gasPrice': gas_price,
+                'chainId': chain_id,
+            }
+            transactions.append((approve, 60000))
+
+        size = chunk_size(latest_block['gasLimit'], TOKEN_GAS_PER_RECIPIENT)
+        for chunk in split_chunks(to_addresses, size):
+            data = encode_call(
+                "disperseToken(address,address[],uint256[])",
+                [token_address, chunk, [token_amount] * len(chunk)]
+            )
+            transactions.append((base_tx(data), TOKEN_GAS_PER_RECIPIENT * len(chunk)))
+
+    # 依次分配 nonce 并广播
+    tx_hashes = []
+    for transaction, default_gas in transactions:
+        transaction['nonce'] = nonce
+        transaction['gas'] = await estimate_or_default(transaction, DISPERSE_BASE_GAS + default_gas)
+        tx_hash = await send_signed(from_account, transaction)
+        print(f"交易已发送: {tx_hash.hex()}")
+        tx_hashes.append(tx_hash)
+        nonce += 1
+
+    return await asyncio.gather(*[w3_async.eth.wait_for_transaction_receipt(tx) for tx in tx_hashes])
+
+
+async def verify_balances(addresses: List[str], before: List[Tuple[int, int]], amount_wei: int,
+                          token_address: Optional[str], token_amount: int) -> List[str]:
+    """一次 multicall 核对分发后的余额，返回未到账的地址"""
+    after = await snapshot_balances(addresses, token_address)
+    missing = []
+    for address, (bnb_before, token_before), (bnb_after, token_after) in zip(addresses, before, after):
+        if bnb_after - bnb_before < amount_wei or token_after - token_before < token_amount:
+            missing.append(address)
+    return missing
+
+
+async def run_sequential(from_account: Account, addresses: List[str], amount_in_bnb: float) -> Tuple[int, float]:
+    """使用 transfer_bnb 的逐笔转账路径，返回 (总 gas, 耗时)"""
+    from transfer_bnb import batch_transfer_bnb, wait_for_transactions
+
+    start = time.perf_counter()
+    tx_hashes = batch_transfer_bnb(from_account, addresses, amount_in_bnb)
+    receipts = await wait_for_transactions(tx_hashes)
+    elapsed = time.perf_counter() - start
+    return sum(r['gasUsed'] for r in receipts), elapsed
+
+
+async def run_disperse(from_account: Account, addresses: List[str], amount_in_bnb: float,
+                       token_address: Optional[str], token_amount: int) -> Tuple[int, float, List]:
+    """使用 Disperse 合约路径，返回 (总 gas, 耗时, 收据)"""
+    start = time.perf_counter()
+    receipts = await disperse_funds(from_account, addresses, amount_in_bnb, token_address, token_amount)
+    elapsed = time.perf_counter() - start
+    return sum(r['gasUsed'] for r in receipts), elapsed, receipts
+
+
+async def main():
+    try:
+        # 设置命令行参数
+        parser = argparse.ArgumentParser(description='通过 Disperse 合约单笔交易批量分发 BNB/代币')
+        parser.add_argument('--wallets', default='wallets/wallets_20241201_044109.json', help='钱包文件')
+        parser.add_argument('--amount', type=float, default=0.01, help='每个钱包分发的 BNB 数量')
+        parser.add_argument('--token', help='同时分发的代币地址')
+        parser.add_argument('--token-amount', type=float, default=0, help='每个钱包分发的代币数量')
+        parser.add_argument('--compare', action='store_true', help='与逐笔转账路径对比 gas 和耗时（建议在本地开发链上运行）')
+        parser.add_argument('--yes', action='store_true', help='跳过确认')
+        args = parser.parse_args()
+
+        main_account = Account.from_key(os.getenv("PRIVATE_KEY"))
+        wallets = load_wallets(args.wallets)
+        addresses = [w3.to_checksum_address(wallet['address']) for wallet in wallets]
+
+        token_address = w3.to_checksum_address(args.token) if args.token else None
+        token_amount = 0
+        if token_address and args.token_amount > 0:
+            decimals = (await aggregate(w3_async, [
+                Call(token_address, "decimals()", returns=('uint8',))
+            ]))[0]
+            token_amount = int(args.token_amount * (10 ** decimals))
+
+        print(f"主钱包地址: {main_account.address}")
+        print(f"将向 {len(addresses)} 个钱包每个分发 {args.amount} BNB")
+        if token_amount:
+            print(f"以及每个 {args.token_amount} 代币 ({token_address})")
+
+        if not args.yes:
+            confirm = input("是否继续? (y/n): ")
+            if confirm.lower() != 'y':
+                return
+
+        if args.compare:
+            print("\n逐笔转账路径...")
+            seq_gas, seq_time = await run_sequential(main_account, addresses, args.amount)
+
+        before = await snapshot_balances(addresses, token_address)
+
+        print("\nDisperse 分发...")
+        gas_used, elapsed, receipts = await run_disperse(
+            main_account, addresses, args.amount, token_address, token_amount
+        )
+
+        failed = [r['transactionHash'].hex() for r in receipts if r['status'] != 1]
+        if failed:
+            print("\n以下交易失败:")
+            for tx in failed:
+                print(f"- {tx}")
+
+        missing = await verify_balances(addresses, before, w3.to_wei(args.amount, 'ether'), token_address, token_amount)
+        if missing:
+            print("\n以下钱包未到账:")
+            for address in missing:
+                print(f"- {address}")
+        else:
+            print("\n所有钱包均已到账!")
+
+        print(f"\nDisperse: {len(receipts)} 笔交易, 每个接收者 gas: {gas_used / len(addresses):.0f}, 耗时: {elapsed:.2f}s")
+        if args.compare:
+            print(f"逐笔转账: {len(addresses)} 笔交易, 每个接收者 gas: {seq_gas / len(addresses):.0f}, 耗时: {seq_time:.2f}s")
+
+    except Exception as e:
+        print(f"发生错误: {str(e)}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
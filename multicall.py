@@ -0,0 +1,126 @@
+from web3 import Web3
+from eth_abi import encode, decode
+import asyncio
+from typing import Dict, List, Optional, Sequence, Any
+
+# Multicall3 在 BSC 及绝大多数 EVM 链上的统一部署地址
+MULTICALL3 = "0xcA11bde05977b3631167028862bE2a173976CA11"
+
+# aggregate3((address,bool,bytes)[]) 的函数选择器
+AGGREGATE3_SELECTOR = Web3.keccak(text="aggregate3((address,bool,bytes)[])")[:4]
+
+# 单次 eth_call 中打包的最大调用数，避免超出节点的 gas/响应大小限制
+DEFAULT_BATCH_SIZE = 500
+
+# 各连接上是否部署了 Multicall3（本地 anvil/hardhat 空链上没有）
+_multicall_available: Dict[int, bool] = {}
+
+
+def _arg_types(signature: str) -> List[str]:
+    """从函数签名中解析参数类型，例如 balanceOf(address) -> ['address']"""
+    inner = signature[signature.index('(') + 1:signature.rindex(')')]
+    return [t for t in inner.split(',') if t]
+
+
+def encode_call(signature: str, args: Sequence[Any] = ()) -> bytes:
+    """编码合约调用数据（选择器 + 参数）"""
+    selector = Web3.keccak(text=signature)[:4]
+    return selector + encode(_arg_types(signature), list(args))
+
+
+class Call:
+    """一个待聚合的只读调用"""
+    __slots__ = ('target', 'signature', 'args', 'returns', 'allow_failure')
+
+    def __init__(self, target: str, signature: str, args: Sequence[Any] = (),
+                 returns: Sequence[str] = ('uint256',), allow_failure: bool = True):
+        self.target = Web3.to_checksum_address(target)
+        self.signature = signature
+        self.args = tuple(args)
+        self.returns = tuple(returns)
+        self.allow_failure = allow_failure
+
+    def calldata(self) -> bytes:
+        return encode_call(self.signature, self.args)
+
+    def decode(self, data: bytes) -> Any:
+        """解码返回数据，只有一个返回值时直接返回该值"""
+        values = decode(list(self.returns), data)
+        return values[0] if len(values) == 1 else values
+
+
+def eth_balance_call(address: str) -> Call:
+    """通过 Multicall3 自带的 getEthBalance 读取 BNB 余额"""
+    return Call(MULTICALL3, "getEthBalance(address)", [Web3.to_checksum_address(address)])
+
+
+def token_balance_call(token: str, address: str) -> Call:
+    """读取代币余额"""
+    return Call(token, "balanceOf(address)", [Web3.to_checksum_address(address)])
+
+
+async def has_multicall(w3_async) -> bool:
+    """链上是否部署了 Multicall3（每个连接只查询一次）"""
+    key = id(w3_async)
+    if key not in _multicall_available:
+        _multicall_available[key] = len(await w3_async.eth.get_code(MULTICALL3)) > 0
+    return _multicall_available[key]
+
+
+async def _call_each(w3_async, calls: List[Call], block_identifier,
+                     state_override: Optional[dict]) -> List[Optional[Any]]:
+    """没有 Multicall3 时逐个（并发）调用，BNB 余额改用 eth_getBalance"""
+    async def call_one(call: Call):
+        try:
+            if call.target == MULTICALL3 and call.signature == "getEthBalance(address)":
+                return await w3_async.eth.get_balance(call.args[0], block_identifier)
+            raw = await w3_async.eth.call(
+                {'to': call.target, 'data': call.calldata()},
+                block_identifier,
+                state_override
+            )
+            return call.decode(bytes(raw)) if raw else None
+        except Exception:
+            if not call.allow_failure:
+                raise
+            return None
+
+    return list(await asyncio.gather(*[call_one(call) for call in calls]))
+
+
+async def aggregate(w3_async, calls: List[Call], block_identifier='latest',
+                    batch_size: int = DEFAULT_BATCH_SIZE, state_override: Optional[dict] = None) -> List[Optional[Any]]:
+    """
+    通过 Multicall3 聚合只读调用
+    每 batch_size 个调用合并为一次 eth_call，失败的调用返回 None
+    state_override 会原样传给 eth_call（例如临时注入辅助合约代码）
+    链上没有 Multicall3 时（本地开发链）退化为逐个调用，返回值相同
+    """
+    if not await has_multicall(w3_async):
+        return await _call_each(w3_async, calls, block_identifier, state_override)
+
+    results: List[Optional[Any]] = []
+
+    for start in range(0, len(calls), batch_size):
+        chunk = calls[start:start + batch_size]
+        payload = AGGREGATE3_SELECTOR + encode(
+            ['(address,bool,bytes)[]'],
+            [[(call.target, call.allow_failure, call.calldata()) for call in chunk]]
+        )
+        raw = await w3_async.eth.call(
+            {'to': MULTICALL3, 'data': payload},
+            block_identifier,
+            state_override
+        )
+        (returned,) = decode(['(bool,bytes)[]'], bytes(raw))
+
+        for call, (success, data) in zip(chunk, returned):
+            if not success or not data:
+                results.append(None)
+                continue
+            try:
+                results.append(call.decode(data))
+            except Exception:
+                results.append(None)
+
+    return results
@@ -1,131 +1,114 @@
-from web3 import Web3
-import json
+from web3 import Web3, AsyncWeb3
 from datetime import datetime, timedelta
 import os
 from dotenv import load_dotenv
+import asyncio
+from typing import Optional
+
+import trading_core
+from rpc_cassette import build_providers
 
 # 加载环境变量
 load_dotenv()
 
 # 连接到 BSC
 BSC_RPC = "https://bsc-dataseed.binance.org/"
-w3 = Web3(Web3.HTTPProvider(BSC_RPC))
+provider, async_provider = build_providers(BSC_RPC)
+w3 = Web3(provider)
+w3_async = AsyncWeb3(async_provider)
 
 # 合约地址
 PANCAKE_ROUTER = "0x10ED43C718714eb63d5aA57B78B54704E256024E"
 WBNB = "0xbb4CdB9CBd36B01bD1cBaEBF2De08d9173bc095c"
 TOKEN = "0xF3c7CECF8cBC3066F9a87b310cEBE198d00479aC"
 
-def get_token_price():
+AMOUNT_IN = Web3.to_wei(0.01, 'ether')
+PATH = [WBNB, TOKEN]
+# 5% 滑点
+SLIPPAGE = 0.05
+
+async def get_token_price_async() -> Optional[int]:
     """
-    获取代币价格
+    获取代币价格（0.01 BNB 能换多少代币）
     """
-    # 加载 Router 合约 ABI
-    with open('abis/pancake_v2.json', 'r') as f:
-        ROUTER_ABI = json.load(f)
-    
-    router = w3.eth.contract(
-        address=w3.to_checksum_address(PANCAKE_ROUTER),
-        abi=ROUTER_ABI
-    )
-    
-    # 查询 0.01 BNB 能换多少代币
-    amount_in = w3.to_wei(0.01, 'ether')
-    path = [WBNB, TOKEN]
-    
     try:
-        amounts_out = router.functions.getAmountsOut(
-            amount_in,
-            path
-        ).call()
-        
-        print(f"0.01 BNB 可以换取: {w3.from_wei(amounts_out[1], 'ether')} 代币")
-        return amounts_out[1]
+        amount_out = await trading_core.quote_v2(w3_async, AMOUNT_IN, PATH, PANCAKE_ROUTER)
+        print(f"0.01 BNB 可以换取: {w3.from_wei(amount_out, 'ether')} 代币")
+        return amount_out
     except Exception as e:
         print(f"获取价格失败: {str(e)}")
         return None
 
-def buy_token():
+async def buy_token_async(expected_amount: Optional[int] = None,
+                          pre: Optional[trading_core.PreTrade] = None):
     """
     购买代币
+    传入已确认的报价和预读数据时直接签名广播，不再重复查询
     """
     account = w3.eth.account.from_key(os.getenv("PRIVATE_KEY"))
-    
-    # 加载 Router 合约 ABI
-    with open('abis/pancake_v2.json', 'r') as f:
-        ROUTER_ABI = json.load(f)
-    
-    router = w3.eth.contract(
-        address=w3.to_checksum_address(PANCAKE_ROUTER),
-        abi=ROUTER_ABI
-    )
-    
+
+    if pre is None:
+        quote = trading_core.quote_v2(w3_async, AMOUNT_IN, PATH, PANCAKE_ROUTER) if expected_amount is None else None
+        pre = await trading_core.prepare(w3_async, account.address, quote)
+    if expected_amount is None:
+        expected_amount = pre.quote
+
     # 设置交易参数
-    amount_in = w3.to_wei(0.01, 'ether')  # 0.01 BNB
-    path = [WBNB, TOKEN]
+    amount_out_min = int(expected_amount * (1 - SLIPPAGE))
     deadline = int((datetime.now() + timedelta(minutes=20)).timestamp())
-    
-    # 获取预期输出数量
-    amounts_out = router.functions.getAmountsOut(amount_in, path).call()
-    amount_out_min = int(amounts_out[1] * 0.95)  # 设置 5% 滑点
-    
-    # 构建交易
-    transaction = router.functions.swapExactETHForTokensSupportingFeeOnTransferTokens(
-        amount_out_min,  # 最小获得的代币数量
-        path,           # 交易路径
-        account.address,  # 接收地址
-        deadline        # 截止时间
-    ).build_transaction({
-        'from': account.address,
-        'value': amount_in,  # 发送的 BNB 数量
-        'gas': 300000,
-        'gasPrice': w3.eth.gas_price,
-        'nonce': w3.eth.get_transaction_count(account.address),
-    })
-    
-    # 签名交易
-    signed_txn = w3.eth.account.sign_transaction(
-        transaction,
-        private_key=os.getenv("PRIVATE_KEY")
+    data = trading_core.swap_exact_eth_for_tokens_data(amount_out_min, PATH, account.address, deadline)
+
+    # 签名、发送并等待交易确认
+    tx_receipt = await trading_core.send_and_wait(
+        w3_async, pre, PANCAKE_ROUTER, data, AMOUNT_IN, 300000, os.getenv("PRIVATE_KEY")
     )
-    
-    # 发送交易
-    tx_hash = w3.eth.send_raw_transaction(signed_txn.raw_transaction)
-    print(f"交易已发送! 交易哈希: {tx_hash.hex()}")
-    
-    # 等待交易确认
-    print("等待交易确认...")
-    tx_receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
-    
+
     if tx_receipt['status'] == 1:
         print(f"交易成功! Gas used: {tx_receipt['gasUsed']}")
     else:
         print("交易失败!")
-    
+
     return tx_receipt
 
-def main():
+def get_token_price() -> Optional[int]:
+    """同步接口，兼容旧的调用方式"""
+    return asyncio.run(get_token_price_async())
+
+def buy_token(expected_amount: Optional[int] = None):
+    """同步接口，兼容旧的调用方式"""
+    return asyncio.run(buy_token_async(expected_amount))
+
+async def main_async():
     try:
-        # 首先查询价格
+        account = w3.eth.account.from_key(os.getenv("PRIVATE_KEY"))
+
+        # 查询价格的同时读取 gas price / nonce / 余额 / chain id，确认后可以直接广播
         print("查询代币价格...")
-        expected_amount = get_token_price()
-        
-        if expected_amount is None:
+        pre = await trading_core.prepare(w3_async, account.address, get_token_price_async())
+
+        if pre.quote is None:
             print("无法获取价格，终止交易")
             return
-        
+
+        if pre.balance < AMOUNT_IN:
+            print(f"BNB 余额不足: {w3.from_wei(pre.balance, 'ether')} BNB")
+            return
+
         # 询问是否继续交易
         response = input("是否继续交易? (y/n): ")
         if response.lower() != 'y':
             print("交易已取消")
             return
-        
-        # 执行购买
+
+        # 执行购买（沿用已确认的报价）
         print("执行购买交易...")
-        receipt = buy_token()
-        
+        receipt = await buy_token_async(pre.quote, pre)
+
     except Exception as e:
         print(f"发生错误: {str(e)}")
 
+def main():
+    asyncio.run(main_async())
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,270 @@
+from web3 import Web3, AsyncWeb3
+import numpy as np
+import os
+from dotenv import load_dotenv
+import asyncio
+from typing import List, Optional, Tuple
+import argparse
+
+from multicall import Call, aggregate, MULTICALL3
+from router_finder import V2Pair, PANCAKE_V2_FACTORY, WBNB, TOKEN, ZERO_ADDRESS
+from rpc_cassette import build_providers
+from token_cache import TokenCache
+
+# 加载环境变量
+load_dotenv()
+
+# 连接到 BSC
+BSC_RPC = os.getenv("BSC_RPC", "https://bsc-dataseed.binance.org/")
+provider, async_provider = build_providers(BSC_RPC)
+w3 = Web3(provider)
+w3_async = AsyncWeb3(async_provider)
+
+DATA_DIR = "data/prices"
+
+# 每个采样点：区块、时间戳、基础币储备、代币储备、价格（每个代币值多少基础币）、固定输入的报价
+SAMPLE_DTYPE = np.dtype([
+    ('block', '<u8'),
+    ('timestamp', '<u8'),
+    ('reserve_base', '<f8'),
+    ('reserve_token', '<f8'),
+    ('price', '<f8'),
+    ('quote', '<f8'),
+])
+
+RING_CAPACITY = 4096
+FLUSH_EVERY = 64
+QUOTE_AMOUNT = Web3.to_wei(0.01, 'ether')
+POLL_INTERVAL = 0.5
+# 落后时每轮并发补读的最大区块数
+MAX_CATCH_UP = 20
+
+
+class RingBuffer:
+    """固定大小的 NumPy 环形缓冲区，保留最近 capacity 个采样"""
+
+    def __init__(self, capacity: int = RING_CAPACITY):
+        self.data = np.zeros(capacity, dtype=SAMPLE_DTYPE)
+        self.capacity = capacity
+        self.total = 0
+
+    def append(self, sample: Tuple):
+        self.data[self.total % self.capacity] = sample
+        self.total += 1
+
+    def latest(self, n: Optional[int] = None) -> np.ndarray:
+        """按时间顺序返回最近 n 个采样"""
+        count = min(self.total, self.capacity)
+        n = count if n is None else min(n, count)
+        end = self.total % self.capacity
+        idx = (np.arange(end - n, end)) % self.capacity
+        return self.data[idx]
+
+    def since(self, total_before: int) -> np.ndarray:
+        """返回自 total_before 之后写入的采样（未被覆盖的部分）"""
+        return self.latest(self.total - total_before)
+
+
+class ColumnStore:
+    """
+    只追加的列式存储：每列一个原始二进制文件（<dir>/<列名>.bin）
+    读取时用 np.memmap 映射，范围查询全部向量化完成
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, column: str) -> str:
+        return os.path.join(self.directory, f"{column}.bin")
+
+    def append(self, samples: np.ndarray):
+        for column in SAMPLE_DTYPE.names:
+            with open(self._path(column), 'ab') as f:
+                f.write(np.ascontiguousarray(samples[column]).tobytes())
+
+    def __len__(self) -> int:
+        # 以最短的列为准，避免写入中断时各列长度不一致
+        lengths = [
+            os.path.getsize(self._path(c)) // SAMPLE_DTYPE[c].itemsize if os.path.exists(self._path(c)) else 0
+            for c in SAMPLE_DTYPE.names
+        ]
+        return min(lengths)
+
+    def column(self, name: str) -> np.ndarray:
+        n = len(self)
+        if n == 0:
+            return np.zeros(0, dtype=SAMPLE_DTYPE[name])
+        return np.memmap(self._path(name), dtype=SAMPLE_DTYPE[name], mode='r', shape=(n,))
+
+    def _range(self, start_block: int, end_block: int) -> slice:
+        blocks = self.column('block')
+        lo = np.searchsorted(blocks, start_block, side='left')
+        hi = np.searchsorted(blocks, end_block, side='right')
+        return slice(lo, hi)
+
+    def price_at_block(self, block: int) -> Optional[float]:
+        """区块 block 时（或之前最近一次采样）的价格"""
+        blocks = self.column('block')
+        i = np.searchsorted(blocks, block, side='right') - 1
+        return float(self.column('price')[i]) if i >= 0 else None
+
+    def vwap(self, start_block: int, end_block: int) -> Optional[float]:
+        """区间 VWAP，成交量取相邻采样间基础币储备的变化量"""
+        r = self._range(start_block, end_block)
+        lo = max(r.start - 1, 0)
+        reserves = self.column('reserve_base')[lo:r.stop]
+        prices = self.column('price')[lo:r.stop]
+        if len(reserves) < 2:
+            return None
+        volume = np.abs(np.diff(reserves))
+        total = volume.sum()
+        if total == 0:
+            return float(prices[-1])
+        return float((prices[1:] * volume).sum() / total)
+
+    def volatility(self, start_block: int, end_block: int) -> Optional[float]:
+        """区间内逐采样对数收益率的标准差"""
+        prices = self.column('price')[self._range(start_block, end_block)]
+        prices = prices[prices > 0]
+        if len(prices) < 3:
+            return None
+        return float(np.std(np.diff(np.log(prices))))
+
+
+class PairRecorder:
+    """单个交易对的采样：环形缓冲区 + 定期落盘"""
+
+    def __init__(self, pair: V2Pair, base: str, base_decimals: int, token_decimals: int,
+                 directory: str = DATA_DIR, flush_every: int = FLUSH_EVERY):
+        self.pair = pair
+        self.base_is_token0 = pair.token0 == base
+        self.scale = 10 ** token_decimals / 10 ** base_decimals
+        self.base_decimals = base_decimals
+        self.token_decimals = token_decimals
+        self.ring = RingBuffer()
+        self.store = ColumnStore(os.path.join(directory, pair.address))
+        self.flush_every = flush_every
+        self._flushed = 0
+
+    def record(self, block: int, timestamp: int, reserve0: int, reserve1: int):
+        self.pair.reserve0, self.pair.reserve1 = reserve0, reserve1
+        reserve_base, reserve_token = (reserve0, reserve1) if self.base_is_token0 else (reserve1, reserve0)
+        price = reserve_base / reserve_token * self.scale if reserve_token else 0.0
+        base = self.pair.token0 if self.base_is_token0 else self.pair.token1
+        quote = self.pair.quote(base, QUOTE_AMOUNT) / 10 ** self.token_decimals
+        self.ring.append((block, timestamp, reserve_base / 10 ** self.base_decimals,
+                          reserve_token / 10 ** self.token_decimals, price, quote))
+        if self.ring.total - self._flushed >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        """把尚未落盘的采样追加到列文件"""
+        pending = self.ring.total - self._flushed
+        if pending > self.ring.capacity:
+            print(f"{self.pair.address}: 有 {pending - self.ring.capacity} 个采样在落盘前被覆盖")
+        if pending > 0:
+            self.store.append(self.ring.since(self._flushed))
+            self._flushed = self.ring.total
+
+
+async def load_recorders(w3_async, tokens: List[str], base: str = WBNB) -> List[PairRecorder]:
+    """查找 token/base 交易对并创建采样器"""
+    tokens = [Web3.to_checksum_address(t) for t in tokens]
+    base = Web3.to_checksum_address(base)
+    token_cache = TokenCache()
+    await token_cache.refresh(w3_async, tokens + [base], probe_tax=False)
+
+    pair_addresses = await aggregate(w3_async, [
+        Call(PANCAKE_V2_FACTORY, "getPair(address,address)", [base, token], returns=('address',))
+        for token in tokens
+    ])
+
+    recorders = []
+    for token, address in zip(tokens, pair_addresses):
+        if not address or address == ZERO_ADDRESS:
+            print(f"代币 {token} 没有 V2 交易对")
+            continue
+        token0, token1 = (base, token) if base.lower() < token.lower() else (token, base)
+        recorders.append(PairRecorder(
+            V2Pair(address, token0, token1), base,
+            token_cache.decimals(base), token_cache.decimals(token)
+        ))
+    return recorders
+
+
+async def read_block(w3_async, recorders: List[PairRecorder], block_number: int) -> Tuple[int, List]:
+    """一次 multicall 读取指定区块的时间戳和所有交易对的储备量"""
+    results = await aggregate(w3_async, [Call(MULTICALL3, "getCurrentBlockTimestamp()")] + [
+        Call(r.pair.address, "getReserves()", returns=('uint112', 'uint112', 'uint32')) for r in recorders
+    ], block_number)
+    timestamp = results[0]
+    if timestamp is None:
+        timestamp = (await w3_async.eth.get_block(block_number))['timestamp']
+    return timestamp, results[1:]
+
+
+async def record_blocks(w3_async, recorders: List[PairRecorder], max_blocks: Optional[int] = None):
+    """
+    逐区块记录所有交易对的储备量
+    两次轮询之间（或上一次读取期间）出现的区块会被逐个补读，不会漏掉
+    """
+    next_block = None
+    recorded = 0
+    while max_blocks is None or recorded < max_blocks:
+        head = await w3_async.eth.block_number
+        if next_block is None:
+            next_block = head
+        if head < next_block:
+            await asyncio.sleep(POLL_INTERVAL)
+            continue
+
+        last = min(head, next_block + MAX_CATCH_UP - 1)
+        if max_blocks is not None:
+            last = min(last, next_block + max_blocks - recorded - 1)
+        numbers = list(range(next_block, last + 1))
+        blocks = await asyncio.gather(*[read_block(w3_async, recorders, n) for n in numbers])
+
+        for block_number, (timestamp, reserves) in zip(numbers, blocks):
+            for recorder, result in zip(recorders, reserves):
+                if result is not None:
+                    recorder.record(block_number, timestamp, result[0], result[1])
+        recorded += len(numbers)
+        next_block = last + 1
+
+
+async def main():
+    recorders = []
+    try:
+        # 设置命令行参数
+        parser = argparse.ArgumentParser(description='逐区块记录交易对储备量和报价')
+        parser.add_argument('tokens', nargs='*', default=[TOKEN], help='代币地址（与 WBNB 的交易对）')
+        parser.add_argument('--blocks', type=int, help='记录的区块数，默认一直运行')
+        args = parser.parse_args()
+
+        recorders = await load_recorders(w3_async, args.tokens)
+        if not recorders:
+            return
+        for recorder in recorders:
+            print(f"记录交易对 {recorder.pair.address} -> {recorder.store.directory}")
+
+        await record_blocks(w3_async, recorders, args.blocks)
+
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        print("\n停止记录")
+    except Exception as e:
+        print(f"发生错误: {str(e)}")
+    finally:
+        for recorder in recorders:
+            recorder.flush()
+            store = recorder.store
+            blocks = store.column('block')
+            if len(blocks):
+                start, end = int(blocks[0]), int(blocks[-1])
+                print(f"\n{recorder.pair.address}: {len(blocks)} 个采样 (区块 {start} - {end})")
+                print(f"最新价格: {store.price_at_block(end)}")
+                print(f"VWAP: {store.vwap(start, end)}")
+                print(f"波动率: {store.volatility(start, end)}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,180 @@
+from web3 import Web3
+import csv
+import importlib.util
+import os
+import queue
+import threading
+from datetime import datetime
+from typing import List, Optional
+
+# ERC20 Transfer 事件签名
+TRANSFER_TOPIC = Web3.keccak(text="Transfer(address,address,uint256)")
+
+# 每攒够多少条记录写一次文件
+FLUSH_BATCH_SIZE = 256
+
+
+class TradeRecord:
+    """单个钱包的一次执行结果（紧凑存储，不保留完整收据）"""
+    __slots__ = (
+        'wallet_index', 'wallet', 'tx_hash', 'status', 'block', 'gas_used',
+        'effective_gas_price', 'bnb_in', 'tokens_out', 'expected_out', 'slippage',
+        't_build', 't_send', 't_confirm', 'error',
+    )
+
+    FIELDS = __slots__
+
+    def __init__(self, wallet_index: int, wallet: str):
+        self.wallet_index = wallet_index
+        self.wallet = wallet
+        self.tx_hash = ''
+        self.status = 0
+        self.block = 0
+        self.gas_used = 0
+        self.effective_gas_price = 0
+        self.bnb_in = 0
+        self.tokens_out = 0
+        self.expected_out = 0
+        self.slippage: Optional[float] = None
+        self.t_build = 0.0
+        self.t_send = 0.0
+        self.t_confirm = 0.0
+        self.error = ''
+
+    def row(self) -> list:
+        return [getattr(self, field) for field in self.FIELDS]
+
+
+def fill_from_receipt(record: TradeRecord, receipt, token: Optional[str] = None, gas_price: int = 0):
+    """从收据中提取记录字段，代币到账数量取自 Transfer 日志"""
+    record.tx_hash = bytes(receipt['transactionHash']).hex()
+    record.status = receipt['status']
+    record.block = receipt['blockNumber']
+    record.gas_used = receipt['gasUsed']
+    record.effective_gas_price = receipt.get('effectiveGasPrice', gas_price)
+
+    if token:
+        token = Web3.to_checksum_address(token)
+        recipient_topic = bytes(12) + bytes.fromhex(record.wallet[2:])
+        record.tokens_out = sum(
+            int.from_bytes(bytes(log['data']), 'big')
+            for log in receipt['logs']
+            if log['address'] == token
+            and len(log['topics']) == 3
+            and bytes(log['topics'][0]) == TRANSFER_TOPIC
+            and bytes(log['topics'][2]) == recipient_topic
+        )
+
+    if record.expected_out:
+        record.slippage = 1 - record.tokens_out / record.expected_out
+
+
+def _require_pyarrow():
+    """Parquet 输出依赖可选的 pyarrow"""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise Exception("写入 Parquet 需要 pyarrow，请先执行: pip install pyarrow")
+    return pa, pq
+
+
+class ResultsSink:
+    """
+    执行结果流式写入器
+    记录先进入队列，由后台线程按批写入 CSV 或 Parquet，内存占用不随钱包数量增长
+    """
+
+    def __init__(self, filename: str, batch_size: int = FLUSH_BATCH_SIZE):
+        self.filename = filename
+        self.batch_size = batch_size
+        self.success_count = 0
+        self.fail_count = 0
+        if filename.endswith('.parquet'):
+            _require_pyarrow()
+        self._queue: queue.Queue = queue.Queue()
+        self._writer = threading.Thread(target=self._run, daemon=True)
+        self._writer.start()
+
+    def add(self, record: TradeRecord):
+        """提交一条记录"""
+        if record.status == 1:
+            self.success_count += 1
+        else:
+            self.fail_count += 1
+        self._queue.put(record)
+
+    def close(self):
+        """写入剩余记录并关闭文件"""
+        self._queue.put(None)
+        self._writer.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _run(self):
+        directory = os.path.dirname(self.filename)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        if self.filename.endswith('.parquet'):
+            write_batch, finish = self._parquet_writer()
+        else:
+            write_batch, finish = self._csv_writer()
+
+        batch: List[TradeRecord] = []
+        while True:
+            record = self._queue.get()
+            if record is not None:
+                batch.append(record)
+            if batch and (record is None or len(batch) >= self.batch_size):
+                write_batch(batch)
+                batch = []
+            if record is None:
+                break
+        finish()
+
+    def _csv_writer(self):
+        f = open(self.filename, 'w', newline='')
+        writer = csv.writer(f)
+        writer.writerow(TradeRecord.FIELDS)
+
+        def write_batch(batch: List[TradeRecord]):
+            writer.writerows(record.row() for record in batch)
+            f.flush()
+
+        return write_batch, f.close
+
+    def _parquet_writer(self):
+        pa, pq = _require_pyarrow()
+
+        # 金额可能超过 int64，统一按字符串保存
+        schema = pa.schema([
+            ('wallet_index', pa.int64()), ('wallet', pa.string()), ('tx_hash', pa.string()),
+            ('status', pa.int8()), ('block', pa.int64()), ('gas_used', pa.int64()),
+            ('effective_gas_price', pa.int64()), ('bnb_in', pa.string()), ('tokens_out', pa.string()),
+            ('expected_out', pa.string()), ('slippage', pa.float64()), ('t_build', pa.float64()),
+            ('t_send', pa.float64()), ('t_confirm', pa.float64()), ('error', pa.string()),
+        ])
+        writer = pq.ParquetWriter(self.filename, schema)
+        big_fields = {'bnb_in', 'tokens_out', 'expected_out'}
+
+        def write_batch(batch: List[TradeRecord]):
+            columns = {
+                field: [str(getattr(r, field)) if field in big_fields else getattr(r, field) for r in batch]
+                for field in TradeRecord.FIELDS
+            }
+            writer.write_table(pa.table(columns, schema=schema))
+
+        return write_batch, writer.close
+
+
+def results_filename(prefix: str, fmt: Optional[str] = None) -> str:
+    """生成结果文件名（包含时间戳），未指定格式时安装了 pyarrow 就用 Parquet，否则用 CSV"""
+    if fmt is None:
+        fmt = 'parquet' if importlib.util.find_spec('pyarrow') is not None else 'csv'
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    return f"results/{prefix}_{timestamp}.{fmt}"
@@ -0,0 +1,403 @@
+from web3 import Web3, AsyncWeb3
+from eth_abi import encode
+import json
+import os
+from dotenv import load_dotenv
+import time
+import asyncio
+from itertools import combinations
+from typing import Dict, List, Optional, Tuple
+import argparse
+
+from multicall import Call, aggregate
+from rpc_cassette import build_providers
+from v3_quoter import V3Pool, load_pool
+
+# 加载环境变量
+load_dotenv()
+
+# BSC 节点（只在命令行入口中连接，作为库导入时不建立连接）
+BSC_RPC = os.getenv("BSC_RPC", "https://bsc-dataseed.binance.org/")
+
+# 合约地址
+PANCAKE_V2_FACTORY = "0xcA143Ce32Fe78f1f7019d7d551a6402fC5350c73"
+PANCAKE_V3_FACTORY = "0x0BFbCF9fa4f9C56B0F40a671Ad40E0805A091865"
+WBNB = "0xbb4CdB9CBd36B01bD1cBaEBF2De08d9173bc095c"
+USDT = "0x55d398326f99059fF775485246999027B3197955"
+BUSD = "0xe9e7CEA3DedcA5984780Bafc599bD69ADd087D56"
+USDC = "0x8AC76a51cc950d9822D68b83fE1Ad97B32Cd580d"
+TOKEN = "0xF3c7CECF8cBC3066F9a87b310cEBE198d00479aC"
+
+# 中间路由代币
+BASE_TOKENS = [WBNB, USDT, BUSD, USDC]
+V3_FEES = [100, 500, 2500, 10000]
+
+# 本地池子索引（交易对是否存在及其地址）
+POOL_INDEX_FILE = "cache/pools.json"
+
+# 路径先按小额报价（查询数量 / ROUTE_PROBE_DIVISOR）排名并缓存到下次刷新储备量，
+# 每次查询只对排名前 ROUTE_SHORTLIST 条做精确报价
+ROUTE_SHORTLIST = 8
+ROUTE_PROBE_DIVISOR = 100
+
+# Universal Router 命令及特殊地址/数量
+V3_SWAP_EXACT_IN = 0x00
+V2_SWAP_EXACT_IN = 0x08
+WRAP_ETH = 0x0b
+MSG_SENDER = "0x0000000000000000000000000000000000000001"
+ADDRESS_THIS = "0x0000000000000000000000000000000000000002"
+CONTRACT_BALANCE = 1 << 255
+
+ZERO_ADDRESS = "0x0000000000000000000000000000000000000000"
+
+
+class V2Pair:
+    """V2 交易对及其缓存的储备量"""
+    __slots__ = ('address', 'token0', 'token1', 'reserve0', 'reserve1')
+    kind = 'v2'
+
+    def __init__(self, address: str, token0: str, token1: str, reserve0: int = 0, reserve1: int = 0):
+        self.address = address
+        self.token0 = token0
+        self.token1 = token1
+        self.reserve0 = reserve0
+        self.reserve1 = reserve1
+
+    def quote(self, token_in: str, amount_in: int) -> int:
+        """PancakeLibrary.getAmountOut（0.25% 手续费）"""
+        if token_in == self.token0:
+            reserve_in, reserve_out = self.reserve0, self.reserve1
+        else:
+            reserve_in, reserve_out = self.reserve1, self.reserve0
+        if amount_in <= 0 or reserve_in == 0 or reserve_out == 0:
+            return 0
+        amount_in_with_fee = amount_in * 9975
+        return amount_in_with_fee * reserve_out // (reserve_in * 10000 + amount_in_with_fee)
+
+
+class Route:
+    """一条多跳路径：pools[i] 把 tokens[i] 换成 tokens[i + 1]"""
+    __slots__ = ('tokens', 'pools')
+
+    def __init__(self, tokens: List[str], pools: List):
+        self.tokens = tokens
+        self.pools = pools
+
+    def quote(self, amount_in: int) -> int:
+        amount = amount_in
+        for token_in, pool in zip(self.tokens, self.pools):
+            amount = pool.quote(token_in, amount)
+            if amount == 0:
+                return 0
+        return amount
+
+    def is_v2(self) -> bool:
+        return all(pool.kind == 'v2' for pool in self.pools)
+
+    def v2_path(self) -> List[str]:
+        """getAmountsOut / swapExact* 使用的路径"""
+        if not self.is_v2():
+            raise Exception("路径包含 V3 池子，不能用于 V2 Router")
+        return list(self.tokens)
+
+    def segments(self) -> List[Tuple[str, List[str], List]]:
+        """按池子类型把路径切成连续的 V2 / V3 段"""
+        result = []
+        for i, pool in enumerate(self.pools):
+            if result and result[-1][0] == pool.kind:
+                result[-1][1].append(self.tokens[i + 1])
+                result[-1][2].append(pool)
+            else:
+                result.append((pool.kind, [self.tokens[i], self.tokens[i + 1]], [pool]))
+        return result
+
+    def describe(self) -> str:
+        hops = [f"{pool.kind}" + (f"/{pool.fee}" if pool.kind == 'v3' else '') for pool in self.pools]
+        return " -> ".join(t[:8] for t in self.tokens) + f" [{', '.join(hops)}]"
+
+
+class RouteFinder:
+    """
+    基于本地池子索引和缓存储备量的路由引擎
+    路径候选在首次查询时枚举并缓存，按小额报价排名后每次查询只精确计算排名靠前的几条
+    """
+
+    def __init__(self, base_tokens: List[str] = BASE_TOKENS, max_hops: int = 3):
+        self.base_tokens = [Web3.to_checksum_address(t) for t in base_tokens]
+        self.max_hops = max_hops
+        self.v2_pairs: Dict[str, V2Pair] = {}
+        self.v3_pools: Dict[str, V3Pool] = {}
+        # token -> [(pool, 另一个 token)]
+        self.graph: Dict[str, List[Tuple[object, str]]] = {}
+        self._routes: Dict[Tuple[str, str], List[Route]] = {}
+        # (token_in, token_out, v2_only) -> 按小额报价排序的路径，储备量变化后失效
+        self._ranked: Dict[Tuple[str, str, bool], List[Route]] = {}
+        self.index: Dict[str, Optional[str]] = {}
+        if os.path.exists(POOL_INDEX_FILE):
+            with open(POOL_INDEX_FILE, 'r') as f:
+                self.index = json.load(f)
+
+    def save_index(self):
+        os.makedirs(os.path.dirname(POOL_INDEX_FILE), exist_ok=True)
+        with open(POOL_INDEX_FILE, 'w') as f:
+            json.dump(self.index, f, indent=4)
+
+    def _add_edge(self, pool, token0: str, token1: str):
+        self.graph.setdefault(token0, []).append((pool, token1))
+        self.graph.setdefault(token1, []).append((pool, token0))
+        self._routes.clear()
+        self._ranked.clear()
+
+    async def build(self, w3_async, tokens: List[str], include_v3: bool = True):
+        """
+        发现 tokens 与中间代币之间的所有 V2 交易对和 V3 池子
+        已在索引中的交易对不再查询工厂合约
+        """
+        universe = sorted({Web3.to_checksum_address(t) for t in list(tokens) + self.base_tokens})
+        pairs = list(combinations(universe, 2))
+
+        keys, calls = [], []
+        for a, b in pairs:
+            key = f"v2:{a}:{b}"
+            if key not in self.index:
+                keys.append(key)
+                calls.append(Call(PANCAKE_V2_FACTORY, "getPair(address,address)", [a, b], returns=('address',)))
+            if include_v3:
+                for fee in V3_FEES:
+                    key = f"v3:{a}:{b}:{fee}"
+                    if key not in self.index:
+                        keys.append(key)
+                        calls.append(Call(PANCAKE_V3_FACTORY, "getPool(address,address,uint24)",
+                                          [a, b, fee], returns=('address',)))
+        if calls:
+            for key, address in zip(keys, await aggregate(w3_async, calls)):
+                self.index[key] = address if address and address != ZERO_ADDRESS else None
+            self.save_index()
+
+        # 加载池子
+        v2_new, v3_new = [], []
+        for a, b in pairs:
+            address = self.index.get(f"v2:{a}:{b}")
+            if address and address not in self.v2_pairs:
+                token0, token1 = (a, b) if a.lower() < b.lower() else (b, a)
+                self.v2_pairs[address] = V2Pair(address, token0, token1)
+                v2_new.append(self.v2_pairs[address])
+            if include_v3:
+                for fee in V3_FEES:
+                    address = self.index.get(f"v3:{a}:{b}:{fee}")
+                    if address and address not in self.v3_pools:
+                        v3_new.append(address)
+
+        await self.refresh_reserves(w3_async)
+        for pair in v2_new:
+            self._add_edge(pair, pair.token0, pair.token1)
+
+        for pool in await asyncio.gather(*[load_pool(w3_async, address) for address in v3_new]):
+            if pool.liquidity == 0:
+                continue
+            self.v3_pools[pool.address] = pool
+            self._add_edge(pool, pool.token0, pool.token1)
+
+    async def refresh_reserves(self, w3_async):
+        """一次 multicall 刷新所有 V2 储备量，V3 池子按事件增量同步"""
+        pairs = list(self.v2_pairs.values())
+        reserves = await aggregate(w3_async, [
+            Call(pair.address, "getReserves()", returns=('uint112', 'uint112', 'uint32')) for pair in pairs
+        ])
+        for pair, result in zip(pairs, reserves):
+            if result is not None:
+                pair.reserve0, pair.reserve1 = result[0], result[1]
+
+        if self.v3_pools:
+            await asyncio.gather(*[pool.sync(w3_async) for pool in self.v3_pools.values()])
+        self._ranked.clear()
+
+    def routes(self, token_in: str, token_out: str) -> List[Route]:
+        """枚举 token_in 到 token_out 的所有简单路径（结果缓存）"""
+        key = (token_in, token_out)
+        if key in self._routes:
+            return self._routes[key]
+
+        found = []
+
+        def walk(token: str, tokens: List[str], pools: List):
+            if len(pools) >= self.max_hops:
+                return
+            for pool, other in self.graph.get(token, []):
+                if other in tokens:
+                    continue
+                if other == token_out:
+                    found.append(Route(tokens + [other], pools + [pool]))
+                elif other in self.base_tokens:
+                    walk(other, tokens + [other], pools + [pool])
+
+        walk(token_in, [token_in], [])
+        self._routes[key] = found
+        return found
+
+    def shortlist(self, token_in: str, token_out: str, amount_in: int, v2_only: bool = False,
+                  size: int = ROUTE_SHORTLIST) -> List[Route]:
+        """按小额报价排名靠前的 size 条路径（排名缓存到下次刷新储备量）"""
+        key = (token_in, token_out, v2_only)
+        ranked = self._ranked.get(key)
+        if ranked is None:
+            routes = self.routes(token_in, token_out)
+            if v2_only:
+                routes = [route for route in routes if route.is_v2()]
+            probe = max(amount_in // ROUTE_PROBE_DIVISOR, 1)
+            ranked = sorted(routes, key=lambda route: route.quote(probe), reverse=True)
+            self._ranked[key] = ranked
+        return ranked[:size]
+
+    def best_route(self, token_in: str, token_out: str, amount_in: int,
+                   v2_only: bool = False) -> Tuple[Optional[Route], int]:
+        """单一路径中输出最多的一条"""
+        token_in = Web3.to_checksum_address(token_in)
+        token_out = Web3.to_checksum_address(token_out)
+        best, best_out = None, 0
+        for route in self.shortlist(token_in, token_out, amount_in, v2_only):
+            amount_out = route.quote(amount_in)
+            if amount_out > best_out:
+                best, best_out = route, amount_out
+        return best, best_out
+
+    def best_split(self, token_in: str, token_out: str, amount_in: int,
+                   parts: int = 10, max_routes: int = 3) -> Tuple[List[Tuple[Route, int]], int]:
+        """
+        拆单路由：在互不共享池子的若干条最优路径间按 1/parts 的粒度
+        贪心分配输入，每一份分给边际输出最大的路径
+        返回 [(路径, 分配的输入)] 及总输出
+        """
+        token_in = Web3.to_checksum_address(token_in)
+        token_out = Web3.to_checksum_address(token_out)
+        ranked = sorted(
+            self.shortlist(token_in, token_out, amount_in, size=max(ROUTE_SHORTLIST, 3 * max_routes)),
+            key=lambda route: route.quote(amount_in),
+            reverse=True,
+        )
+
+        # 选出互不共享池子的候选路径
+        candidates, used_pools = [], set()
+        for route in ranked:
+            pool_ids = {id(pool) for pool in route.pools}
+            if pool_ids & used_pools:
+                continue
+            candidates.append(route)
+            used_pools |= pool_ids
+            if len(candidates) >= max_routes:
+                break
+        if not candidates:
+            return [], 0
+
+        part = amount_in // parts
+        allocation = [0] * len(candidates)
+        outputs = [0] * len(candidates)
+        for i in range(parts):
+            size = part if i < parts - 1 else amount_in - part * (parts - 1)
+            best_j, best_gain, best_out = 0, -1, 0
+            for j, route in enumerate(candidates):
+                out = route.quote(allocation[j] + size)
+                if out - outputs[j] > best_gain:
+                    best_j, best_gain, best_out = j, out - outputs[j], out
+            allocation[best_j] += size
+            outputs[best_j] = best_out
+
+        legs = [(route, amount) for route, amount in zip(candidates, allocation) if amount > 0]
+        return legs, sum(outputs)
+
+
+def encode_v3_path(tokens: List[str], pools: List[V3Pool]) -> bytes:
+    """V3 路径编码：token(20) + fee(3) + token(20) ..."""
+    path = bytes.fromhex(tokens[0][2:])
+    for token, pool in zip(tokens[1:], pools):
+        path += pool.fee.to_bytes(3, 'big') + bytes.fromhex(token[2:])
+    return path
+
+
+def encode_universal_router(legs: List[Tuple[Route, int]], recipient: str, slippage: float,
+                            wrap_eth: bool = True) -> Tuple[bytes, List[bytes]]:
+    """
+    把路由结果编码为 Universal Router 的 commands / inputs
+    每条路径按连续的 V2/V3 段生成命令，中间段输出留在 Router 中，
+    下一段用 CONTRACT_BALANCE 取用；最后一段按滑点设置最小输出并发给 recipient
+    """
+    commands = []
+    inputs = []
+
+    if wrap_eth:
+        total_in = sum(amount for _, amount in legs)
+        commands.append(WRAP_ETH)
+        inputs.append(encode(['address', 'uint256'], [ADDRESS_THIS, total_in]))
+
+    for route, amount_in in legs:
+        amount_out_min = int(route.quote(amount_in) * (1 - slippage))
+        segments = route.segments()
+        for i, (kind, tokens, pools) in enumerate(segments):
+            last = i == len(segments) - 1
+            seg_recipient = recipient if last else ADDRESS_THIS
+            seg_amount_in = amount_in if i == 0 else CONTRACT_BALANCE
+            seg_min_out = amount_out_min if last else 0
+            if kind == 'v2':
+                commands.append(V2_SWAP_EXACT_IN)
+                inputs.append(encode(
+                    ['address', 'uint256', 'uint256', 'address[]', 'bool'],
+                    [seg_recipient, seg_amount_in, seg_min_out, tokens, False]
+                ))
+            else:
+                commands.append(V3_SWAP_EXACT_IN)
+                inputs.append(encode(
+                    ['address', 'uint256', 'uint256', 'bytes', 'bool'],
+                    [seg_recipient, seg_amount_in, seg_min_out, encode_v3_path(tokens, pools), False]
+                ))
+
+    return bytes(commands), inputs
+
+
+async def main():
+    try:
+        # 设置命令行参数
+        parser = argparse.ArgumentParser(description='在 V2/V3 池子间查找最优路由')
+        parser.add_argument('--token', default=TOKEN, help='买入的代币')
+        parser.add_argument('--amount', type=float, default=0.01, help='输入的 BNB 数量')
+        parser.add_argument('--no-v3', action='store_true', help='只使用 V2 交易对')
+        args = parser.parse_args()
+
+        provider, async_provider = build_providers(BSC_RPC)
+        w3_async = AsyncWeb3(async_provider)
+
+        token = Web3.to_checksum_address(args.token)
+        amount_in = Web3.to_wei(args.amount, 'ether')
+
+        print("构建池子索引...")
+        start = time.perf_counter()
+        finder = RouteFinder()
+        await finder.build(w3_async, [token], include_v3=not args.no_v3)
+        print(f"V2 交易对: {len(finder.v2_pairs)}, V3 池子: {len(finder.v3_pools)}, "
+              f"耗时: {time.perf_counter() - start:.2f}s")
+
+        start = time.perf_counter()
+        route, amount_out = finder.best_route(WBNB, token, amount_in)
+        route_us = (time.perf_counter() - start) * 1e6
+        if route is None:
+            print("未找到路径")
+            return
+        print(f"\n最优单一路径: {route.describe()}")
+        print(f"输出: {amount_out} ({route_us:.0f}µs)")
+
+        start = time.perf_counter()
+        legs, split_out = finder.best_split(WBNB, token, amount_in)
+        split_us = (time.perf_counter() - start) * 1e6
+        print(f"\n拆单路由输出: {split_out} ({split_us:.0f}µs)")
+        for leg, leg_amount in legs:
+            print(f"- {Web3.from_wei(leg_amount, 'ether')} BNB: {leg.describe()}")
+
+        commands, inputs = encode_universal_router(legs, MSG_SENDER, 0.05)
+        print(f"\nUniversal Router commands: {commands.hex()}")
+        for data in inputs:
+            print(f"input: {data.hex()}")
+
+    except Exception as e:
+        print(f"发生错误: {str(e)}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,214 @@
+from web3 import HTTPProvider, AsyncHTTPProvider
+from web3.providers.base import BaseProvider
+from web3.providers.async_base import AsyncBaseProvider
+import asyncio
+import atexit
+import gzip
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Dict, List, Optional, Tuple
+
+# 环境变量：RPC_MODE=record|replay，RPC_CASSETTE=录像文件路径
+# RPC_REPLAY_LATENCY=none（尽快回放）或 recorded（按录制时的延迟回放）
+DEFAULT_CASSETTE = "cassettes/rpc.jsonl.gz"
+
+# 同一进程内多个模块共用同一个录像文件
+_cassettes: Dict[str, 'Cassette'] = {}
+# 回放时同理共用同一个 ReplayStore，各模块按同一顺序消费录制的响应
+_replay_stores: Dict[str, 'ReplayStore'] = {}
+
+
+def _to_json(value):
+    """参数中的 bytes 统一编码为十六进制字符串"""
+    if isinstance(value, (bytes, bytearray)):
+        return '0x' + bytes(value).hex()
+    raise TypeError(f"无法序列化 {type(value)}")
+
+
+def request_key(method: str, params) -> str:
+    """请求的匹配键"""
+    return method + json.dumps(params, default=_to_json, sort_keys=True, separators=(',', ':'))
+
+
+class Cassette:
+    """
+    JSON-RPC 录像文件（gzip 压缩的 JSON lines）
+    每行记录 method / params / response / 耗时 / 相对开始时间的偏移
+    """
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.start = time.perf_counter()
+        self._lock = threading.Lock()
+        directory = os.path.dirname(filename)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = gzip.open(filename, 'wt')
+        atexit.register(self.close)
+
+    def append(self, method: str, params, response, started: float, elapsed: float):
+        line = json.dumps({
+            'm': method,
+            'p': params,
+            'r': response,
+            't': round(elapsed, 6),
+            'o': round(started - self.start, 6),
+        }, default=_to_json, separators=(',', ':'))
+        with self._lock:
+            self._file.write(line + '\n')
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+
+def load_cassette(filename: str) -> List[Dict]:
+    """读取录像文件"""
+    with gzip.open(filename, 'rt') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class RecordingHTTPProvider(HTTPProvider):
+    """录制模式的同步 provider：转发请求并记录请求与响应"""
+
+    def __init__(self, endpoint_uri: str, cassette: Cassette, **kwargs):
+        super().__init__(endpoint_uri, **kwargs)
+        self.cassette = cassette
+
+    def make_request(self, method, params):
+        started = time.perf_counter()
+        response = super().make_request(method, params)
+        self.cassette.append(method, params, response, started, time.perf_counter() - started)
+        return response
+
+
+class AsyncRecordingHTTPProvider(AsyncHTTPProvider):
+    """录制模式的异步 provider"""
+
+    def __init__(self, endpoint_uri: str, cassette: Cassette, **kwargs):
+        super().__init__(endpoint_uri, **kwargs)
+        self.cassette = cassette
+
+    async def make_request(self, method, params):
+        started = time.perf_counter()
+        response = await super().make_request(method, params)
+        self.cassette.append(method, params, response, started, time.perf_counter() - started)
+        return response
+
+
+class ReplayStore:
+    """
+    回放数据
+    优先按 (method, params) 精确匹配并按录制顺序依次返回；
+    参数不同（如 deadline、签名交易）时退回到同一 method 的下一条未使用记录；
+    记录用完后重复返回最后一次的响应（例如轮询 eth_blockNumber）
+    """
+
+    def __init__(self, entries: List[Dict]):
+        self.entries = entries
+        self.used = [False] * len(entries)
+        self.by_key: Dict[str, deque] = defaultdict(deque)
+        self.by_method: Dict[str, deque] = defaultdict(deque)
+        self.last_by_key: Dict[str, int] = {}
+        self.last_by_method: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        for i, entry in enumerate(entries):
+            self.by_key[request_key(entry['m'], entry['p'])].append(i)
+            self.by_method[entry['m']].append(i)
+
+    def _next_unused(self, queue: deque) -> Optional[int]:
+        while queue:
+            i = queue.popleft()
+            if not self.used[i]:
+                return i
+        return None
+
+    def lookup(self, method: str, params) -> Tuple[Dict, float]:
+        """返回 (响应, 录制时的耗时)"""
+        key = request_key(method, params)
+        with self._lock:
+            i = self._next_unused(self.by_key.get(key, deque()))
+            if i is None and key in self.last_by_key:
+                i = self.last_by_key[key]
+            if i is None:
+                i = self._next_unused(self.by_method.get(method, deque()))
+            if i is None:
+                i = self.last_by_method.get(method)
+            if i is None:
+                raise Exception(f"录像中没有 {method} 的记录")
+
+            self.used[i] = True
+            self.last_by_key[key] = i
+            self.last_by_method[method] = i
+
+        entry = self.entries[i]
+        return entry['r'], entry['t']
+
+
+class ReplayProvider(BaseProvider):
+    """回放模式的同步 provider，不访问网络"""
+
+    def __init__(self, store: ReplayStore, latency: str = 'none'):
+        super().__init__()
+        self.store = store
+        self.latency = latency
+
+    def make_request(self, method, params):
+        response, elapsed = self.store.lookup(method, params)
+        if self.latency == 'recorded':
+            time.sleep(elapsed)
+        return response
+
+    def is_connected(self, show_traceback: bool = False) -> bool:
+        return True
+
+
+class AsyncReplayProvider(AsyncBaseProvider):
+    """回放模式的异步 provider"""
+
+    def __init__(self, store: ReplayStore, latency: str = 'none'):
+        super().__init__()
+        self.store = store
+        self.latency = latency
+
+    async def make_request(self, method, params):
+        response, elapsed = self.store.lookup(method, params)
+        if self.latency == 'recorded':
+            await asyncio.sleep(elapsed)
+        return response
+
+    async def is_connected(self, show_traceback: bool = False) -> bool:
+        return True
+
+
+def build_providers(endpoint_uri: str):
+    """
+    根据环境变量创建 (同步 provider, 异步 provider)
+    未设置 RPC_MODE 时直接连接 endpoint_uri
+    """
+    mode = os.getenv("RPC_MODE", "").lower()
+    filename = os.getenv("RPC_CASSETTE", DEFAULT_CASSETTE)
+
+    if mode == 'record':
+        if filename not in _cassettes:
+            _cassettes[filename] = Cassette(filename)
+        cassette = _cassettes[filename]
+        print(f"RPC 录制模式: {filename}")
+        return (
+            RecordingHTTPProvider(endpoint_uri, cassette),
+            AsyncRecordingHTTPProvider(endpoint_uri, cassette),
+        )
+
+    if mode == 'replay':
+        latency = os.getenv("RPC_REPLAY_LATENCY", "none").lower()
+        if filename not in _replay_stores:
+            _replay_stores[filename] = ReplayStore(load_cassette(filename))
+            print(f"RPC 回放模式: {filename} ({len(_replay_stores[filename].entries)} 条记录, 延迟: {latency})")
+        store = _replay_stores[filename]
+        return ReplayProvider(store, latency), AsyncReplayProvider(store, latency)
+
+    return HTTPProvider(endpoint_uri), AsyncHTTPProvider(endpoint_uri)
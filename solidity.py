@@ -0,0 +1,36 @@
+from functools import lru_cache
+from typing import Dict
+
+# 编译辅助合约时使用的 solc 版本
+SOLC_VERSION = "0.8.19"
+
+
+@lru_cache(maxsize=None)
+def compile_contract(source: str, contract_name: str) -> Dict:
+    """
+    编译内嵌的 Solidity 源码，返回 abi / bytecode / runtime 字节码
+    依赖可选的 py-solc-x（pip install py-solc-x），首次使用时会下载 solc
+    """
+    try:
+        import solcx
+    except ImportError:
+        raise Exception("编译合约需要 py-solc-x，请先执行: pip install py-solc-x")
+
+    if SOLC_VERSION not in [str(v) for v in solcx.get_installed_solc_versions()]:
+        solcx.install_solc(SOLC_VERSION)
+
+    compiled = solcx.compile_source(
+        source,
+        output_values=['abi', 'bin', 'bin-runtime'],
+        solc_version=SOLC_VERSION,
+        optimize=True,
+    )
+    for key, artifact in compiled.items():
+        if key.split(':')[-1] == contract_name:
+            return {
+                'abi': artifact['abi'],
+                'bytecode': '0x' + artifact['bin'],
+                'runtime': '0x' + artifact['bin-runtime'],
+            }
+
+    raise Exception(f"编译结果中未找到合约 {contract_name}")
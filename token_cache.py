@@ -0,0 +1,227 @@
+from web3 import Web3
+import json
+import os
+import time
+from typing import Dict, Iterable, List, Optional
+
+from multicall import Call, aggregate
+from solidity import compile_contract
+
+# 缓存文件及默认有效期（秒）
+CACHE_FILE = "cache/tokens.json"
+DEFAULT_TTL = 24 * 3600
+
+PANCAKE_ROUTER = "0x10ED43C718714eb63d5aA57B78B54704E256024E"
+WBNB = "0xbb4CdB9CBd36B01bD1cBaEBF2De08d9173bc095c"
+
+# 税率探测：把 TaxProbe 运行时代码通过 state override 注入到该地址，
+# 并给它足够的 BNB 余额，用 eth_call 模拟一次买入 + 卖出
+PROBE_ADDRESS = Web3.to_checksum_address("0x00000000000000000000000000000000007a5b0e")
+PROBE_BALANCE = Web3.to_wei(1000, 'ether')
+PROBE_AMOUNT = Web3.to_wei(0.01, 'ether')
+# 每笔探测约 30 万 gas，控制单次 eth_call 的总 gas
+PROBE_BATCH_SIZE = 50
+
+TAX_PROBE_SOURCE = """
+// SPDX-License-Identifier: MIT
+pragma solidity ^0.8.0;
+
+interface IRouter {
+    function getAmountsOut(uint256 amountIn, address[] calldata path) external view returns (uint256[] memory);
+    function swapExactETHForTokensSupportingFeeOnTransferTokens(
+        uint256 amountOutMin, address[] calldata path, address to, uint256 deadline) external payable;
+    function swapExactTokensForETHSupportingFeeOnTransferTokens(
+        uint256 amountIn, uint256 amountOutMin, address[] calldata path, address to, uint256 deadline) external;
+}
+
+interface IERC20 {
+    function balanceOf(address account) external view returns (uint256);
+    function approve(address spender, uint256 value) external returns (bool);
+}
+
+contract TaxProbe {
+    receive() external payable {}
+
+    function probe(address router, address wbnb, address token, uint256 amountIn)
+        external
+        returns (uint256 buyExpected, uint256 buyReceived, uint256 sellExpected, uint256 sellReceived)
+    {
+        address[] memory path = new address[](2);
+        path[0] = wbnb;
+        path[1] = token;
+
+        buyExpected = IRouter(router).getAmountsOut(amountIn, path)[1];
+        uint256 tokenBefore = IERC20(token).balanceOf(address(this));
+        IRouter(router).swapExactETHForTokensSupportingFeeOnTransferTokens{value: amountIn}(
+            0, path, address(this), block.timestamp);
+        buyReceived = IERC20(token).balanceOf(address(this)) - tokenBefore;
+
+        path[0] = token;
+        path[1] = wbnb;
+        IERC20(token).approve(router, type(uint256).max);
+        sellExpected = IRouter(router).getAmountsOut(buyReceived, path)[1];
+        uint256 ethBefore = address(this).balance;
+        IRouter(router).swapExactTokensForETHSupportingFeeOnTransferTokens(
+            buyReceived, 0, path, address(this), block.timestamp);
+        sellReceived = address(this).balance - ethBefore;
+    }
+}
+"""
+
+
+def _tax(expected: int, received: int) -> Optional[float]:
+    """根据预期与实际到账数量计算税率"""
+    if not expected:
+        return None
+    return min(1.0, max(0.0, 1 - received / expected))
+
+
+class TokenCache:
+    """
+    代币元数据及买卖税率的本地缓存
+    读取（decimals / tax / min_amount_out）只查内存，不访问网络；
+    refresh 按 TTL 判断过期，并通过 multicall 批量补全
+    元数据和税率分别记录更新时间（updated_at / tax_updated_at），只读元数据的刷新不会让税率看起来是新的；
+    tax_status 为 ok（已测得）、failed（模拟买卖回滚，例如无法卖出）或 None（尚未探测）
+    """
+
+    def __init__(self, filename: str = CACHE_FILE, ttl: int = DEFAULT_TTL):
+        self.filename = filename
+        self.ttl = ttl
+        self.tokens: Dict[str, Dict] = {}
+        if os.path.exists(filename):
+            with open(filename, 'r') as f:
+                self.tokens = json.load(f)
+
+    def save(self):
+        """写回缓存文件"""
+        directory = os.path.dirname(self.filename)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.filename, 'w') as f:
+            json.dump(self.tokens, f, indent=4)
+
+    def get(self, token: str) -> Optional[Dict]:
+        return self.tokens.get(Web3.to_checksum_address(token))
+
+    def is_fresh(self, token: str, with_tax: bool = False) -> bool:
+        """元数据（以及 with_tax 时的税率）是否在 TTL 内"""
+        entry = self.get(token)
+        if entry is None or time.time() - entry['updated_at'] >= self.ttl:
+            return False
+        if not with_tax:
+            return True
+        tax_updated_at = entry.get('tax_updated_at')
+        return tax_updated_at is not None and time.time() - tax_updated_at < self.ttl
+
+    def tax_status(self, token: str) -> Optional[str]:
+        return (self.get(token) or {}).get('tax_status')
+
+    def _tax_field(self, token: str, field: str) -> float:
+        entry = self.get(token) or {}
+        if entry.get('tax_status') == 'failed':
+            raise Exception(f"代币 {token} 税率探测失败（模拟买卖回滚，可能无法卖出）")
+        return entry.get(field) or 0.0
+
+    def decimals(self, token: str) -> int:
+        return self.get(token)['decimals']
+
+    def buy_tax(self, token: str) -> float:
+        """买入税率，尚未探测时按 0 处理，探测失败时抛出异常"""
+        return self._tax_field(token, 'buy_tax')
+
+    def sell_tax(self, token: str) -> float:
+        """卖出税率，尚未探测时按 0 处理，探测失败时抛出异常"""
+        return self._tax_field(token, 'sell_tax')
+
+    def expected_out(self, token: str, quoted: int) -> int:
+        """getAmountsOut 报价扣除买入税后的预期到账数量"""
+        return int(quoted * (1 - self.buy_tax(token)))
+
+    def min_amount_out(self, token: str, quoted: int, slippage: float) -> int:
+        """按代币实际买入税和滑点计算最小到账数量"""
+        return int(self.expected_out(token, quoted) * (1 - slippage))
+
+    async def refresh(self, w3_async, tokens: Iterable[str], router: str = PANCAKE_ROUTER,
+                      wbnb: str = WBNB, probe_tax: bool = True) -> List[str]:
+        """补全过期或缺失的代币，返回本次更新的地址"""
+        stale = []
+        for token in tokens:
+            token = Web3.to_checksum_address(token)
+            if not self.is_fresh(token, probe_tax) and token not in stale:
+                stale.append(token)
+        if not stale:
+            return []
+
+        # 元数据：每个代币 3 个调用，合并到一次 multicall
+        calls = []
+        for token in stale:
+            calls += [
+                Call(token, "decimals()", returns=('uint8',)),
+                Call(token, "symbol()", returns=('string',)),
+                Call(token, "totalSupply()"),
+            ]
+        values = await aggregate(w3_async, calls)
+
+        taxes = None
+        if probe_tax:
+            taxes = await self._probe_taxes(w3_async, stale, router, wbnb)
+
+        now = time.time()
+        for i, token in enumerate(stale):
+            decimals, symbol, total_supply = values[3 * i:3 * i + 3]
+            if decimals is None:
+                print(f"代币 {token} 元数据读取失败")
+                continue
+            # 只刷新元数据时保留已有的税率记录
+            entry = self.tokens.setdefault(token, {
+                'buy_tax': None, 'sell_tax': None, 'tax_status': None, 'tax_updated_at': None,
+            })
+            entry.update({
+                'decimals': decimals,
+                'symbol': symbol,
+                'total_supply': str(total_supply) if total_supply is not None else None,
+                'updated_at': now,
+            })
+            if taxes is not None:
+                if taxes[i] is None:
+                    entry.update({'buy_tax': None, 'sell_tax': None, 'tax_status': 'failed'})
+                    print(f"代币 {token} 税率探测失败（模拟买卖回滚）")
+                else:
+                    entry.update({'buy_tax': taxes[i][0], 'sell_tax': taxes[i][1], 'tax_status': 'ok'})
+                entry['tax_updated_at'] = now
+
+        self.save()
+        return stale
+
+    async def _probe_taxes(self, w3_async, tokens: List[str], router: str, wbnb: str) -> Optional[List]:
+        """
+        通过注入 TaxProbe 的 eth_call 批量模拟买卖，测量买入/卖出税
+        返回每个代币的 (买入税, 卖出税)，模拟回滚的位置为 None；无法探测（没有编译器）时返回 None
+        """
+        try:
+            runtime = compile_contract(TAX_PROBE_SOURCE, "TaxProbe")['runtime']
+        except Exception as e:
+            print(f"跳过税率探测: {str(e)}")
+            return None
+
+        state_override = {PROBE_ADDRESS: {'code': runtime, 'balance': PROBE_BALANCE}}
+        calls = [
+            Call(
+                PROBE_ADDRESS,
+                "probe(address,address,address,uint256)",
+                [Web3.to_checksum_address(router), Web3.to_checksum_address(wbnb), token, PROBE_AMOUNT],
+                returns=('uint256', 'uint256', 'uint256', 'uint256'),
+            )
+            for token in tokens
+        ]
+        results = await aggregate(w3_async, calls, batch_size=PROBE_BATCH_SIZE, state_override=state_override)
+
+        taxes = []
+        for result in results:
+            if result is None:
+                taxes.append(None)
+                continue
+            buy_expected, buy_received, sell_expected, sell_received = result
+            taxes.append((_tax(buy_expected, buy_received), _tax(sell_expected, sell_received)))
+        return taxes
@@ -0,0 +1,101 @@
+import asyncio
+import time
+from typing import Awaitable, Dict, List, Optional
+
+from multicall import Call, encode_call
+
+# 合约地址
+PANCAKE_ROUTER = "0x10ED43C718714eb63d5aA57B78B54704E256024E"
+
+# 预读数据超过该时间（秒，例如等待用户确认太久）后，广播前重新读取 gas price 和 nonce
+PREPARED_TTL = 30.0
+
+
+class PreTrade:
+    """交易前并发读取的链上数据"""
+    __slots__ = ('address', 'gas_price', 'nonce', 'balance', 'chain_id', 'quote', 'fetched_at')
+
+    def __init__(self, address: str, gas_price: int, nonce: int, balance: int, chain_id: int,
+                 quote=None):
+        self.address = address
+        self.gas_price = gas_price
+        self.nonce = nonce
+        self.balance = balance
+        self.chain_id = chain_id
+        self.quote = quote
+        self.fetched_at = time.monotonic()
+
+
+async def prepare(w3_async, address: str, quote: Optional[Awaitable] = None) -> PreTrade:
+    """
+    同时读取 gas price、pending nonce、BNB 余额、chain id 以及（可选的）报价
+    所有读取并发完成，只需一次往返的时间
+    """
+    reads = [
+        w3_async.eth.gas_price,
+        w3_async.eth.get_transaction_count(address, 'pending'),
+        w3_async.eth.get_balance(address),
+        w3_async.eth.chain_id,
+    ]
+    if quote is not None:
+        reads.append(quote)
+    results = await asyncio.gather(*reads)
+    return PreTrade(address, *results)
+
+
+async def refresh(w3_async, pre: PreTrade, max_age: float = PREPARED_TTL):
+    """预读数据过期时重新读取 gas price 和 nonce（报价保持用户确认时的值）"""
+    if time.monotonic() - pre.fetched_at <= max_age:
+        return
+    pre.gas_price, pre.nonce = await asyncio.gather(
+        w3_async.eth.gas_price,
+        w3_async.eth.get_transaction_count(pre.address, 'pending'),
+    )
+    pre.fetched_at = time.monotonic()
+
+
+async def quote_v2(w3_async, amount_in: int, path: List[str], router: str = PANCAKE_ROUTER) -> int:
+    """Router.getAmountsOut，返回最后一跳的输出数量"""
+    call = Call(router, "getAmountsOut(uint256,address[])", [amount_in, path], returns=('uint256[]',))
+    raw = await w3_async.eth.call({'to': call.target, 'data': call.calldata()})
+    return call.decode(bytes(raw))[-1]
+
+
+def swap_exact_eth_for_tokens_data(amount_out_min: int, path: List[str], recipient: str, deadline: int) -> bytes:
+    """swapExactETHForTokensSupportingFeeOnTransferTokens 的调用数据"""
+    return encode_call(
+        "swapExactETHForTokensSupportingFeeOnTransferTokens(uint256,address[],address,uint256)",
+        [amount_out_min, path, recipient, deadline]
+    )
+
+
+def execute_data(commands: bytes, inputs: List[bytes], deadline: int) -> bytes:
+    """Universal Router execute 的调用数据"""
+    return encode_call("execute(bytes,bytes[],uint256)", [commands, inputs, deadline])
+
+
+def build_transaction(pre: PreTrade, to: str, data: bytes, value: int, gas: int) -> Dict:
+    """用预读数据构建完整交易，签名时无需再访问节点"""
+    return {
+        'from': pre.address,
+        'to': to,
+        'data': data,
+        'value': value,
+        'gas': gas,
+        'gasPrice': pre.gas_price,
+        'nonce': pre.nonce,
+        'chainId': pre.chain_id,
+    }
+
+
+async def send_and_wait(w3_async, pre: PreTrade, to: str, data: bytes, value: int, gas: int,
+                        private_key: str):
+    """签名并广播（确认到广播之间只有 send_raw_transaction 一次往返），然后等待收据"""
+    await refresh(w3_async, pre)
+    transaction = build_transaction(pre, to, data, value, gas)
+    signed_txn = w3_async.eth.account.sign_transaction(transaction, private_key)
+    tx_hash = await w3_async.eth.send_raw_transaction(signed_txn.raw_transaction)
+    print(f"交易已发送! 交易哈希: {tx_hash.hex()}")
+
+    print("等待交易确认...")
+    return await w3_async.eth.wait_for_transaction_receipt(tx_hash)
@@ -3,73 +3,32 @@ import json
 import os
 from dotenv import load_dotenv
 from eth_account import Account
-import time
 import asyncio
-from typing import List, Dict, Tuple
+from typing import List, Dict
 import argparse
 
+from balance_ledger import BalanceLedger
+from rpc_cassette import build_providers
+from token_cache import TokenCache
+
 # 加载环境变量
 load_dotenv()
 
 # 连接到 BSC
-BSC_RPC = "https://bsc-dataseed.binance.org/"
-w3 = Web3(Web3.HTTPProvider(BSC_RPC))
+BSC_RPC = os.getenv("BSC_RPC", "https://bsc-dataseed.binance.org/")
+# 通过 RPC_MODE=record|replay 录制或回放 JSON-RPC 流量
+provider, async_provider = build_providers(BSC_RPC)
+w3 = Web3(provider)
 # 异步 web3
-w3_async = AsyncWeb3(AsyncWeb3.AsyncHTTPProvider(BSC_RPC))
-
-# Token ABI
-TOKEN_ABI = [
-    {
-        "inputs": [{"internalType": "address", "name": "account", "type": "address"}],
-        "name": "balanceOf",
-        "outputs": [{"internalType": "uint256", "name": "", "type": "uint256"}],
-        "stateMutability": "view",
-        "type": "function"
-    },
-    {
-        "inputs": [],
-        "name": "decimals",
-        "outputs": [{"internalType": "uint8", "name": "", "type": "uint8"}],
-        "stateMutability": "view",
-        "type": "function"
-    }
-]
+w3_async = AsyncWeb3(async_provider)
+# 代币元数据缓存
+token_cache = TokenCache()
 
 def load_wallets(filename: str) -> List[Dict]:
     """加载钱包文件"""
     with open(filename, 'r') as f:
         return json.load(f)
 
-async def get_token_decimals(token_contract) -> int:
-    """获取代币精度"""
-    return await token_contract.functions.decimals().call()
-
-async def check_balances(addresses: List[str], token_address: str) -> List[Tuple[float, float]]:
-    """同时检查所有钱包的 BNB 和代币余额"""
-    # 创建异步合约实例
-    token_contract = w3_async.eth.contract(address=token_address, abi=TOKEN_ABI)
-    
-    # 获取代币精度
-    decimals = await get_token_decimals(token_contract)
-    
-    async def check_single_wallet(address: str) -> Tuple[float, float]:
-        # 同时获取 BNB 和代币余额
-        bnb_balance, token_balance = await asyncio.gather(
-            w3_async.eth.get_balance(address),
-            token_contract.functions.balanceOf(address).call()
-        )
-        
-        return (
-            w3.from_wei(bnb_balance, 'ether'),
-            token_balance / (10 ** decimals)
-        )
-    
-    # 为所有钱包创建查询任务
-    tasks = [check_single_wallet(addr) for addr in addresses]
-    
-    # 同时执行所有任务
-    return await asyncio.gather(*tasks)
-
 def batch_transfer_bnb(from_account: Account, to_addresses: List[str], amount_in_bnb: float):
     """批量转账 BNB"""
     nonce = w3.eth.get_transaction_count(from_account.address)
@@ -93,7 +52,7 @@ def batch_transfer_bnb(from_account: Account, to_addresses: List[str], amount_in
     # 批量发送交易
     tx_hashes = []
     for signed_txn in transactions:
-        tx_hash = w3.eth.send_raw_transaction(signed_txn.rawTransaction)
+        tx_hash = w3.eth.send_raw_transaction(signed_txn.raw_transaction)
         tx_hashes.append(tx_hash)
     
     return tx_hashes
@@ -107,6 +66,13 @@ async def wait_for_transactions(tx_hashes: List[str]):
     
     return await asyncio.gather(*[wait_for_tx(tx) for tx in tx_hashes])
 
+def print_balances(wallets: List[Dict], ledger: BalanceLedger, decimals: int):
+    """打印账本中各钱包的余额"""
+    for wallet in wallets:
+        bnb, token = ledger.balance(wallet['address'])
+        print(f"钱包 {wallet['index']}: {wallet['address']}")
+        print(f"BNB: {w3.from_wei(bnb, 'ether'):.4f}, Token: {token / (10 ** decimals):.4f}")
+
 async def main():
     try:
         # 设置命令行参数
@@ -124,14 +90,15 @@ async def main():
         
         print(f"主钱包地址: {main_account.address}")
         
-        # 检查所有钱包余额
+        # 检查所有钱包余额（一次 multicall 快照，之后按日志和收据增量更新）
         print("\n检查所有钱包余额...")
-        balances = await check_balances(addresses, token_address)
+        await token_cache.refresh(w3_async, [token_address], probe_tax=False)
+        decimals = token_cache.decimals(token_address)
+        ledger = BalanceLedger(addresses + [main_account.address], token_address)
+        await ledger.snapshot(w3_async)
         
         print("\n当前余额:")
-        for wallet, (bnb, token) in zip(wallets, balances):
-            print(f"钱包 {wallet['index']}: {wallet['address']}")
-            print(f"BNB: {bnb:.4f}, Token: {token:.4f}")
+        print_balances(wallets, ledger, decimals)
         
         # 如果只是查询余额，到这里就结束
         if args.balance:
@@ -154,16 +121,14 @@ async def main():
         print("\n等待交易确认...")
         receipts = await wait_for_transactions(tx_hashes)
         
-        print("\n等待区块链更新...")
-        await asyncio.sleep(3)
-        
-        print("\n检查最终余额...")
-        final_balances = await check_balances(addresses, token_address)
+        # 收据所在区块确认后即可得到最终余额，无需等待和重新扫描
+        amount_wei = w3.to_wei(amount_per_wallet, 'ether')
+        for receipt in receipts:
+            ledger.apply_receipt(receipt, amount_wei)
+        await ledger.sync(w3_async, max(receipt['blockNumber'] for receipt in receipts))
         
         print("\n最终余额:")
-        for wallet, (bnb, token) in zip(wallets, final_balances):
-            print(f"钱包 {wallet['index']}: {wallet['address']}")
-            print(f"BNB: {bnb:.4f}, Token: {token:.4f}")
+        print_balances(wallets, ledger, decimals)
         
         # 检查交易状态
         failed_txs = [tx.hex() for receipt, tx in zip(receipts, tx_hashes) if receipt['status'] != 1]
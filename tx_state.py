@@ -0,0 +1,50 @@
+import asyncio
+import time
+from typing import Dict, Optional
+
+# gas price 缓存时间（秒）
+GAS_PRICE_TTL = 3.0
+
+
+class NonceManager:
+    """
+    按钱包在本地分配 nonce
+    每个钱包只在首次使用（或出错重置后）向节点查询一次 pending nonce
+    """
+
+    def __init__(self, w3_async):
+        self.w3_async = w3_async
+        self._next: Dict[str, int] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    async def next(self, address: str) -> int:
+        """分配下一个 nonce"""
+        lock = self._locks.setdefault(address, asyncio.Lock())
+        async with lock:
+            if address not in self._next:
+                self._next[address] = await self.w3_async.eth.get_transaction_count(address, 'pending')
+            nonce = self._next[address]
+            self._next[address] = nonce + 1
+            return nonce
+
+    def reset(self, address: str):
+        """广播失败后丢弃本地计数，下次重新从节点读取"""
+        self._next.pop(address, None)
+
+
+class GasOracle:
+    """共享的 gas price，缓存 GAS_PRICE_TTL 秒，并发请求只会触发一次查询"""
+
+    def __init__(self, w3_async, ttl: float = GAS_PRICE_TTL):
+        self.w3_async = w3_async
+        self.ttl = ttl
+        self._price: Optional[int] = None
+        self._updated = 0.0
+        self._lock = asyncio.Lock()
+
+    async def gas_price(self) -> int:
+        async with self._lock:
+            if self._price is None or time.monotonic() - self._updated > self.ttl:
+                self._price = await self.w3_async.eth.gas_price
+                self._updated = time.monotonic()
+            return self._price
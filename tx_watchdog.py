@@ -0,0 +1,209 @@
+from web3 import Web3
+from web3.exceptions import TransactionNotFound
+import asyncio
+from typing import Dict, List, Optional
+
+# 默认策略：等待 3 个区块未确认就提价重发
+BUMP_AFTER_BLOCKS = 3
+# 每次提价的比例（节点替换规则要求至少 10%）
+BUMP_PERCENT = 12.5
+MIN_REPLACEMENT_PERCENT = 10
+MAX_BUMPS = 5
+# 超过该区块数仍未确认则放弃等待
+TIMEOUT_BLOCKS = 60
+# nonce 已被消耗但查不到收据时，继续查找的区块数（负载均衡节点可能有落后的后端）
+RECEIPT_RETRY_BLOCKS = 3
+POLL_INTERVAL = 1.0
+
+
+def bump_price(price: int, percent: float = BUMP_PERCENT) -> int:
+    """按比例提价，并保证满足节点的最小替换幅度"""
+    bumped = int(price * (100 + percent) / 100)
+    minimum = price * (100 + MIN_REPLACEMENT_PERCENT) // 100 + 1
+    return max(bumped, minimum)
+
+
+class InFlightTx:
+    """一笔在途交易及其所有已广播的版本"""
+    __slots__ = ('wallet', 'nonce', 'transaction', 'private_key', 'hashes',
+                 'sent_block', 'last_bump_block', 'bumps', 'receipt_misses', 'future')
+
+    def __init__(self, wallet: str, nonce: int, transaction: Dict, private_key: str,
+                 tx_hash: bytes, sent_block: int, future: asyncio.Future):
+        self.wallet = wallet
+        self.nonce = nonce
+        self.transaction = transaction
+        self.private_key = private_key
+        self.hashes: List[bytes] = [tx_hash]
+        self.sent_block = sent_block
+        self.last_bump_block = sent_block
+        self.bumps = 0
+        self.receipt_misses = 0
+        self.future = future
+
+
+class TxWatchdog:
+    """
+    在途交易看门狗
+    按钱包跟踪已广播的交易，超过 bump_after_blocks 个区块未确认时
+    用相同 nonce 提价重签并重新广播，任一版本上链后返回其收据
+    """
+
+    def __init__(self, w3_async, bump_after_blocks: int = BUMP_AFTER_BLOCKS,
+                 bump_percent: float = BUMP_PERCENT, max_bumps: int = MAX_BUMPS,
+                 max_gas_price: Optional[int] = None, timeout_blocks: int = TIMEOUT_BLOCKS,
+                 poll_interval: float = POLL_INTERVAL):
+        self.w3_async = w3_async
+        self.bump_after_blocks = bump_after_blocks
+        self.bump_percent = bump_percent
+        self.max_bumps = max_bumps
+        self.max_gas_price = max_gas_price
+        self.timeout_blocks = timeout_blocks
+        self.poll_interval = poll_interval
+        # 钱包地址 -> nonce -> 在途交易
+        self.in_flight: Dict[str, Dict[int, InFlightTx]] = {}
+        # 原始交易哈希 -> 在途交易
+        self.by_hash: Dict[bytes, InFlightTx] = {}
+        self._monitor: Optional[asyncio.Task] = None
+
+    async def send(self, transaction: Dict, private_key: str) -> bytes:
+        """签名并广播交易，登记到看门狗，返回首个版本的交易哈希"""
+        signed_txn = self.w3_async.eth.account.sign_transaction(transaction, private_key)
+        return await self.send_signed(transaction, private_key, signed_txn.raw_transaction)
+
+    async def send_signed(self, transaction: Dict, private_key: str, raw_transaction: bytes,
+                          sent_block: Optional[int] = None) -> bytes:
+        """广播已签名的交易并登记到看门狗；已知当前区块时传入 sent_block 省去一次查询"""
+        if sent_block is None:
+            tx_hash, block_number = await asyncio.gather(
+                self.w3_async.eth.send_raw_transaction(raw_transaction),
+                self.w3_async.eth.block_number,
+            )
+        else:
+            tx_hash = await self.w3_async.eth.send_raw_transaction(raw_transaction)
+            block_number = sent_block
+        tx_hash = bytes(tx_hash)
+
+        wallet = Web3.to_checksum_address(transaction['from'])
+        entry = InFlightTx(
+            wallet, transaction['nonce'], dict(transaction), private_key,
+            tx_hash, block_number, asyncio.get_running_loop().create_future()
+        )
+        self.in_flight.setdefault(wallet, {})[entry.nonce] = entry
+        self.by_hash[tx_hash] = entry
+
+        if self._monitor is None or self._monitor.done():
+            self._monitor = asyncio.create_task(self._run())
+
+        return tx_hash
+
+    async def wait(self, tx_hash: bytes):
+        """等待交易（任一版本）上链，返回收据"""
+        entry = self.by_hash[bytes(tx_hash)]
+        try:
+            return await entry.future
+        finally:
+            self.by_hash.pop(entry.hashes[0], None)
+
+    def future(self, tx_hash: bytes) -> asyncio.Future:
+        """在途交易的结果（收据），可被多个协程同时等待"""
+        return self.by_hash[bytes(tx_hash)].future
+
+    async def submit(self, transaction: Dict, private_key: str):
+        """广播并等待确认"""
+        return await self.wait(await self.send(transaction, private_key))
+
+    def _resolve(self, entry: InFlightTx, receipt=None, error: Optional[Exception] = None):
+        """结束一笔在途交易"""
+        wallet_txs = self.in_flight.get(entry.wallet, {})
+        wallet_txs.pop(entry.nonce, None)
+        if not wallet_txs:
+            self.in_flight.pop(entry.wallet, None)
+
+        if entry.future.done():
+            return
+        if error is not None:
+            entry.future.set_exception(error)
+        else:
+            entry.future.set_result(receipt)
+
+    async def _find_receipt(self, entry: InFlightTx):
+        """查找已上链的版本"""
+        for tx_hash in reversed(entry.hashes):
+            try:
+                return await self.w3_async.eth.get_transaction_receipt(tx_hash)
+            except TransactionNotFound:
+                continue
+        return None
+
+    async def _bump(self, entry: InFlightTx, block_number: int):
+        """用相同 nonce 提价重签并广播"""
+        transaction = dict(entry.transaction)
+        if 'maxFeePerGas' in transaction:
+            transaction['maxFeePerGas'] = bump_price(transaction['maxFeePerGas'], self.bump_percent)
+            transaction['maxPriorityFeePerGas'] = bump_price(transaction['maxPriorityFeePerGas'], self.bump_percent)
+            new_price = transaction['maxFeePerGas']
+        else:
+            network_price = await self.w3_async.eth.gas_price
+            new_price = max(bump_price(transaction['gasPrice'], self.bump_percent), network_price)
+            transaction['gasPrice'] = new_price
+
+        if self.max_gas_price is not None and new_price > self.max_gas_price:
+            # 已到上限，之后不再尝试提价，只等待上链或超时
+            entry.bumps = self.max_bumps
+            print(f"钱包 {entry.wallet} nonce {entry.nonce} 提价将超过上限 {self.max_gas_price}，停止提价")
+            return
+
+        entry.last_bump_block = block_number
+        signed_txn = self.w3_async.eth.account.sign_transaction(transaction, entry.private_key)
+        try:
+            tx_hash = await self.w3_async.eth.send_raw_transaction(signed_txn.raw_transaction)
+        except Exception as e:
+            # nonce too low / already known 说明已有版本上链或在池中，下一轮检查时处理
+            print(f"钱包 {entry.wallet} nonce {entry.nonce} 重发失败: {str(e)}")
+            return
+
+        entry.transaction = transaction
+        entry.hashes.append(bytes(tx_hash))
+        entry.bumps += 1
+        print(f"钱包 {entry.wallet} nonce {entry.nonce} 提价重发: {bytes(tx_hash).hex()} (gasPrice {new_price})")
+
+    async def _check_wallet(self, wallet: str, entries: List[InFlightTx], block_number: int):
+        """检查一个钱包的所有在途交易"""
+        confirmed_nonce = await self.w3_async.eth.get_transaction_count(wallet, 'latest')
+
+        for entry in entries:
+            if entry.nonce < confirmed_nonce:
+                receipt = await self._find_receipt(entry)
+                if receipt is not None:
+                    self._resolve(entry, receipt)
+                    continue
+                # 可能是节点后端落后，下个区块再查，连续多次查不到才认定 nonce 被其他交易使用
+                entry.receipt_misses += 1
+                if entry.receipt_misses >= RECEIPT_RETRY_BLOCKS:
+                    self._resolve(entry, error=Exception(f"nonce {entry.nonce} 已被其他交易使用"))
+                continue
+
+            if block_number - entry.sent_block >= self.timeout_blocks:
+                self._resolve(entry, error=Exception(f"交易超过 {self.timeout_blocks} 个区块未确认"))
+                continue
+
+            if (entry.bumps < self.max_bumps
+                    and block_number - entry.last_bump_block >= self.bump_after_blocks):
+                await self._bump(entry, block_number)
+
+    async def _run(self):
+        """每个新区块检查一次所有在途交易，全部结束后退出"""
+        last_block = None
+        while self.in_flight:
+            try:
+                block_number = await self.w3_async.eth.block_number
+                if block_number != last_block:
+                    last_block = block_number
+                    await asyncio.gather(*[
+                        self._check_wallet(wallet, list(entries.values()), block_number)
+                        for wallet, entries in list(self.in_flight.items())
+                    ])
+            except Exception as e:
+                print(f"看门狗检查出错: {str(e)}")
+            await asyncio.sleep(self.poll_interval)
@@ -1,29 +1,33 @@
-from web3 import Web3
-import json
+from web3 import Web3, AsyncWeb3
 from datetime import datetime, timedelta
 import os
 from dotenv import load_dotenv
+import asyncio
+
+import trading_core
+from rpc_cassette import build_providers
 
 # 加载环境变量
 load_dotenv()
 
 # 连接到 BSC
 BSC_RPC = "https://bsc-dataseed.binance.org/"
-w3 = Web3(Web3.HTTPProvider(BSC_RPC))
+provider, async_provider = build_providers(BSC_RPC)
+w3 = Web3(provider)
+w3_async = AsyncWeb3(async_provider)
 
 # 合约地址
 UNIVERSAL_ROUTER_ADDRESS = w3.to_checksum_address("0x1a0a18ac4becddbd6389559687d1a73d8927e416")
 
-# 加载 ABI
-with open('abis/pancake_universal_router.json', 'r') as f:
-    UNIVERSAL_ROUTER_ABI = json.load(f)
-
-def main():
+async def main_async():
     try:
         account = w3.eth.account.from_key(os.getenv("PRIVATE_KEY"))
         
+        # 同时读取余额 / gas price / nonce / chain id，确认后直接签名广播
+        pre = await trading_core.prepare(w3_async, account.address)
+        
         # 检查 BNB 余额
-        balance = w3.eth.get_balance(account.address)
+        balance = pre.balance
         bnb_balance = w3.from_wei(balance, 'ether')
         required_bnb = 0.01
         
@@ -51,19 +55,8 @@ def main():
         # 设置新的 deadline（当前时间 + 20分钟）
         deadline = int((datetime.now() + timedelta(minutes=20)).timestamp())
         
-        # 创建合约实例并构建交易
-        router = w3.eth.contract(address=UNIVERSAL_ROUTER_ADDRESS, abi=UNIVERSAL_ROUTER_ABI)
-        transaction = router.functions.execute(
-            commands,
-            inputs,
-            deadline
-        ).build_transaction({
-            'from': account.address,
-            'gas': 366321,
-            'gasPrice': w3.eth.gas_price,
-            'nonce': w3.eth.get_transaction_count(account.address),
-            'value': w3.to_wei(0.01, 'ether')
-        })
+        # 编码调用数据（无需加载 ABI）
+        data = trading_core.execute_data(commands, inputs, deadline)
         
         # 确认交易
         print(f"\n交易详情:")
@@ -75,13 +68,11 @@ def main():
         if confirm.lower() != 'y':
             return
         
-        # 签名并发送交易
-        signed_txn = w3.eth.account.sign_transaction(transaction, os.getenv("PRIVATE_KEY"))
-        tx_hash = w3.eth.send_raw_transaction(signed_txn.raw_transaction)
-        print(f"交易已发送: {tx_hash.hex()}")
-        
-        # 等待交易确认
-        receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
+        # 签名、发送并等待交易确认
+        receipt = await trading_core.send_and_wait(
+            w3_async, pre, UNIVERSAL_ROUTER_ADDRESS, data, w3.to_wei(0.01, 'ether'), 366321,
+            os.getenv("PRIVATE_KEY")
+        )
         if receipt['status'] == 1:
             print(f"交易成功!")
         else:
@@ -90,5 +81,9 @@ def main():
     except Exception as e:
         print(f"错误: {str(e)}")
 
+def main():
+    """同步接口，兼容旧的调用方式"""
+    asyncio.run(main_async())
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
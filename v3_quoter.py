@@ -0,0 +1,482 @@
+from web3 import Web3, AsyncWeb3
+from eth_abi import decode
+import os
+from dotenv import load_dotenv
+import time
+import asyncio
+from typing import Dict, List, Tuple
+import argparse
+
+from multicall import Call, aggregate
+from rpc_cassette import build_providers
+
+# 加载环境变量
+load_dotenv()
+
+# BSC 节点（只在命令行入口中连接，作为库导入时不建立连接）
+BSC_RPC = os.getenv("BSC_RPC", "https://bsc-dataseed.binance.org/")
+
+# PancakeSwap V3 QuoterV2，用于核对本地报价
+PANCAKE_V3_QUOTER = "0xB048Bbc1Ee6b733FFfCFb9e9CeF7375518e25997"
+
+# TickMath 常量
+MIN_TICK = -887272
+MAX_TICK = 887272
+MIN_SQRT_RATIO = 4295128739
+MAX_SQRT_RATIO = 1461446703485210103287273052203988822378723970342
+MAX_UINT256 = (1 << 256) - 1
+MAX_UINT160 = (1 << 160) - 1
+Q96 = 1 << 96
+FEE_DENOMINATOR = 1000000
+
+# 单次 eth_getLogs 查询的最大区块数（公共 BSC 节点会拒绝过大的范围）
+LOG_CHUNK_BLOCKS = 2000
+
+# PancakeSwap V3 Swap 事件多了两个协议费字段，这里同时兼容 Uniswap V3 的格式
+SWAP_TOPIC = Web3.keccak(text="Swap(address,address,int256,int256,uint160,uint128,int24,uint128,uint128)")
+UNISWAP_SWAP_TOPIC = Web3.keccak(text="Swap(address,address,int256,int256,uint160,uint128,int24)")
+MINT_TOPIC = Web3.keccak(text="Mint(address,address,int24,int24,uint128,uint256,uint256)")
+BURN_TOPIC = Web3.keccak(text="Burn(address,int24,int24,uint128,uint256,uint256)")
+
+# getSqrtRatioAtTick 中每一位对应的 Q128 乘数
+_TICK_RATIOS = (
+    (0x2, 0xfff97272373d413259a46990580e213a),
+    (0x4, 0xfff2e50f5f656932ef12357cf3c7fdcc),
+    (0x8, 0xffe5caca7e10e4e61c3624eaa0941cd0),
+    (0x10, 0xffcb9843d60f6159c9db58835c926644),
+    (0x20, 0xff973b41fa98c081472e6896dfb254c0),
+    (0x40, 0xff2ea16466c96a3843ec78b326b52861),
+    (0x80, 0xfe5dee046a99a2a811c461f1969c3053),
+    (0x100, 0xfcbe86c7900a88aedcffc83b479aa3a4),
+    (0x200, 0xf987a7253ac413176f2b074cf7815e54),
+    (0x400, 0xf3392b0822b70005940c7a398e4b70f3),
+    (0x800, 0xe7159475a2c29b7443b29c7fa6e889d9),
+    (0x1000, 0xd097f3bdfd2022b8845ad8f792aa5825),
+    (0x2000, 0xa9f746462d870fdf8a65dc1f90e061e5),
+    (0x4000, 0x70d869a156d2a1b890bb3df62baf32f7),
+    (0x8000, 0x31be135f97d08fd981231505542fcfa6),
+    (0x10000, 0x9aa508b5b7a84e1c677de54f3e99bc9),
+    (0x20000, 0x5d6af8dedb81196699c329225ee604),
+    (0x40000, 0x2216e584f5fa1ea926041bedfe98),
+    (0x80000, 0x48a170391f7dc42444e8fa2),
+)
+
+
+# ---- 整数数学，逐行对应 Uniswap V3 core 的 Solidity 实现 ----
+
+def mul_div(a: int, b: int, denominator: int) -> int:
+    return a * b // denominator
+
+
+def mul_div_rounding_up(a: int, b: int, denominator: int) -> int:
+    return -(-(a * b) // denominator)
+
+
+def div_rounding_up(a: int, b: int) -> int:
+    return -(-a // b)
+
+
+def get_sqrt_ratio_at_tick(tick: int) -> int:
+    """TickMath.getSqrtRatioAtTick"""
+    abs_tick = abs(tick)
+    if abs_tick > MAX_TICK:
+        raise ValueError("tick 超出范围")
+
+    ratio = 0xfffcb933bd6fad37aa2d162d1a594001 if abs_tick & 0x1 else 0x100000000000000000000000000000000
+    for bit, multiplier in _TICK_RATIOS:
+        if abs_tick & bit:
+            ratio = (ratio * multiplier) >> 128
+
+    if tick > 0:
+        ratio = MAX_UINT256 // ratio
+
+    return (ratio >> 32) + (0 if ratio % (1 << 32) == 0 else 1)
+
+
+def get_tick_at_sqrt_ratio(sqrt_price_x96: int) -> int:
+    """TickMath.getTickAtSqrtRatio：满足 getSqrtRatioAtTick(tick) <= sqrtPrice 的最大 tick"""
+    if not MIN_SQRT_RATIO <= sqrt_price_x96 < MAX_SQRT_RATIO:
+        raise ValueError("sqrtPrice 超出范围")
+
+    ratio = sqrt_price_x96 << 32
+    msb = ratio.bit_length() - 1
+    r = ratio >> (msb - 127) if msb >= 128 else ratio << (127 - msb)
+
+    # log2(ratio) 的 Q64.64 定点数，小数部分逐位平方求出（与 Solidity 一样取 14 位）
+    log_2 = (msb - 128) << 64
+    for bit in range(63, 49, -1):
+        r = (r * r) >> 127
+        f = r >> 128
+        log_2 |= f << bit
+        r >>= f
+
+    log_sqrt10001 = log_2 * 255738958999603826347141
+    tick_low = (log_sqrt10001 - 3402992956809132418596140100660247210) >> 128
+    tick_high = (log_sqrt10001 + 291339464771989622907027621153398088495) >> 128
+
+    if tick_low == tick_high:
+        return tick_low
+    return tick_high if get_sqrt_ratio_at_tick(tick_high) <= sqrt_price_x96 else tick_low
+
+
+def get_next_sqrt_price_from_amount0_rounding_up(sqrt_price: int, liquidity: int, amount: int) -> int:
+    """SqrtPriceMath.getNextSqrtPriceFromAmount0RoundingUp（add = true）"""
+    if amount == 0:
+        return sqrt_price
+    numerator1 = liquidity << 96
+
+    # Solidity 中先检查 amount * sqrtPrice 和分母是否溢出 uint256，溢出时换用另一条公式
+    product = amount * sqrt_price
+    if product <= MAX_UINT256:
+        denominator = numerator1 + product
+        if denominator <= MAX_UINT256:
+            return mul_div_rounding_up(numerator1, sqrt_price, denominator)
+
+    return div_rounding_up(numerator1, numerator1 // sqrt_price + amount)
+
+
+def get_next_sqrt_price_from_amount1_rounding_down(sqrt_price: int, liquidity: int, amount: int) -> int:
+    """SqrtPriceMath.getNextSqrtPriceFromAmount1RoundingDown（add = true）"""
+    if amount <= MAX_UINT160:
+        quotient = (amount << 96) // liquidity
+    else:
+        quotient = mul_div(amount, Q96, liquidity)
+    return sqrt_price + quotient
+
+
+def get_next_sqrt_price_from_input(sqrt_price: int, liquidity: int, amount_in: int, zero_for_one: bool) -> int:
+    if zero_for_one:
+        return get_next_sqrt_price_from_amount0_rounding_up(sqrt_price, liquidity, amount_in)
+    return get_next_sqrt_price_from_amount1_rounding_down(sqrt_price, liquidity, amount_in)
+
+
+def get_amount0_delta(sqrt_a: int, sqrt_b: int, liquidity: int, round_up: bool) -> int:
+    if sqrt_a > sqrt_b:
+        sqrt_a, sqrt_b = sqrt_b, sqrt_a
+    numerator1 = liquidity << 96
+    numerator2 = sqrt_b - sqrt_a
+    if round_up:
+        return div_rounding_up(mul_div_rounding_up(numerator1, numerator2, sqrt_b), sqrt_a)
+    return mul_div(numerator1, numerator2, sqrt_b) // sqrt_a
+
+
+def get_amount1_delta(sqrt_a: int, sqrt_b: int, liquidity: int, round_up: bool) -> int:
+    if sqrt_a > sqrt_b:
+        sqrt_a, sqrt_b = sqrt_b, sqrt_a
+    if round_up:
+        return mul_div_rounding_up(liquidity, sqrt_b - sqrt_a, Q96)
+    return mul_div(liquidity, sqrt_b - sqrt_a, Q96)
+
+
+def compute_swap_step_exact_in(sqrt_current: int, sqrt_target: int, liquidity: int,
+                               amount_remaining: int, fee_pips: int) -> Tuple[int, int, int, int]:
+    """SwapMath.computeSwapStep 的精确输入分支，返回 (sqrtNext, amountIn, amountOut, feeAmount)"""
+    zero_for_one = sqrt_current >= sqrt_target
+
+    amount_remaining_less_fee = mul_div(amount_remaining, FEE_DENOMINATOR - fee_pips, FEE_DENOMINATOR)
+    if zero_for_one:
+        amount_in = get_amount0_delta(sqrt_target, sqrt_current, liquidity, True)
+    else:
+        amount_in = get_amount1_delta(sqrt_current, sqrt_target, liquidity, True)
+
+    if amount_remaining_less_fee >= amount_in:
+        sqrt_next = sqrt_target
+    else:
+        sqrt_next = get_next_sqrt_price_from_input(sqrt_current, liquidity, amount_remaining_less_fee, zero_for_one)
+
+    reached = sqrt_target == sqrt_next
+    if zero_for_one:
+        if not reached:
+            amount_in = get_amount0_delta(sqrt_next, sqrt_current, liquidity, True)
+        amount_out = get_amount1_delta(sqrt_next, sqrt_current, liquidity, False)
+    else:
+        if not reached:
+            amount_in = get_amount1_delta(sqrt_current, sqrt_next, liquidity, True)
+        amount_out = get_amount0_delta(sqrt_current, sqrt_next, liquidity, False)
+
+    if not reached:
+        fee_amount = amount_remaining - amount_in
+    else:
+        fee_amount = mul_div_rounding_up(amount_in, fee_pips, FEE_DENOMINATOR - fee_pips)
+
+    return sqrt_next, amount_in, amount_out, fee_amount
+
+
+def _to_signed(value: int, bits: int) -> int:
+    return value - (1 << bits) if value >= 1 << (bits - 1) else value
+
+
+class V3Pool:
+    """
+    V3 池子的本地快照：slot0、当前流动性、tick bitmap 及已初始化 tick 的 liquidityNet
+    通过 Swap/Mint/Burn 事件增量更新，报价完全在本地计算
+    """
+    kind = 'v3'
+
+    def __init__(self, address: str, token0: str, token1: str, fee: int, tick_spacing: int,
+                 sqrt_price_x96: int, tick: int, liquidity: int, block: int):
+        self.address = Web3.to_checksum_address(address)
+        self.token0 = Web3.to_checksum_address(token0)
+        self.token1 = Web3.to_checksum_address(token1)
+        self.fee = fee
+        self.tick_spacing = tick_spacing
+        self.sqrt_price_x96 = sqrt_price_x96
+        self.tick = tick
+        self.liquidity = liquidity
+        self.block = block
+        # wordPos -> uint256 位图
+        self.bitmap: Dict[int, int] = {}
+        # tick -> [liquidityGross, liquidityNet]
+        self.ticks: Dict[int, List[int]] = {}
+
+    # ---- tick bitmap ----
+
+    def _flip_tick(self, tick: int):
+        compressed = tick // self.tick_spacing
+        word_pos, bit_pos = compressed >> 8, compressed & 0xff
+        word = self.bitmap.get(word_pos, 0) ^ (1 << bit_pos)
+        if word:
+            self.bitmap[word_pos] = word
+        else:
+            self.bitmap.pop(word_pos, None)
+
+    def next_initialized_tick_within_one_word(self, tick: int, lte: bool) -> Tuple[int, bool]:
+        """TickBitmap.nextInitializedTickWithinOneWord"""
+        spacing = self.tick_spacing
+        compressed = tick // spacing
+
+        if lte:
+            word_pos, bit_pos = compressed >> 8, compressed & 0xff
+            mask = (1 << bit_pos) - 1 + (1 << bit_pos)
+            masked = self.bitmap.get(word_pos, 0) & mask
+            if masked:
+                return (compressed - (bit_pos - (masked.bit_length() - 1))) * spacing, True
+            return (compressed - bit_pos) * spacing, False
+
+        word_pos, bit_pos = (compressed + 1) >> 8, (compressed + 1) & 0xff
+        mask = MAX_UINT256 ^ ((1 << bit_pos) - 1)
+        masked = self.bitmap.get(word_pos, 0) & mask
+        if masked:
+            lsb = (masked & -masked).bit_length() - 1
+            return (compressed + 1 + (lsb - bit_pos)) * spacing, True
+        return (compressed + 1 + (255 - bit_pos)) * spacing, False
+
+    # ---- 报价 ----
+
+    def quote_exact_input(self, amount_in: int, zero_for_one: bool,
+                          sqrt_price_limit_x96: int = 0) -> Tuple[int, int, int]:
+        """
+        模拟 UniswapV3Pool.swap 的精确输入路径
+        返回 (amountOut, 交换后的 sqrtPriceX96, 跨越的已初始化 tick 数)
+        """
+        if sqrt_price_limit_x96 == 0:
+            sqrt_price_limit_x96 = MIN_SQRT_RATIO + 1 if zero_for_one else MAX_SQRT_RATIO - 1
+
+        remaining = amount_in
+        amount_out = 0
+        sqrt_price = self.sqrt_price_x96
+        tick = self.tick
+        liquidity = self.liquidity
+        crossed = 0
+
+        while remaining != 0 and sqrt_price != sqrt_price_limit_x96:
+            sqrt_start = sqrt_price
+            tick_next, initialized = self.next_initialized_tick_within_one_word(tick, zero_for_one)
+            tick_next = max(MIN_TICK, min(MAX_TICK, tick_next))
+            sqrt_next = get_sqrt_ratio_at_tick(tick_next)
+
+            if zero_for_one:
+                target = sqrt_price_limit_x96 if sqrt_next < sqrt_price_limit_x96 else sqrt_next
+            else:
+                target = sqrt_price_limit_x96 if sqrt_next > sqrt_price_limit_x96 else sqrt_next
+
+            sqrt_price, step_in, step_out, step_fee = compute_swap_step_exact_in(
+                sqrt_price, target, liquidity, remaining, self.fee
+            )
+            remaining -= step_in + step_fee
+            amount_out += step_out
+
+            if sqrt_price == sqrt_next:
+                if initialized:
+                    net = self.ticks[tick_next][1]
+                    liquidity += -net if zero_for_one else net
+                    crossed += 1
+                tick = tick_next - 1 if zero_for_one else tick_next
+            elif sqrt_price != sqrt_start:
+                tick = get_tick_at_sqrt_ratio(sqrt_price)
+
+        return amount_out, sqrt_price, crossed
+
+    def quote(self, token_in: str, amount_in: int) -> int:
+        """按输入代币（checksum 地址）报价"""
+        zero_for_one = token_in == self.token0
+        return self.quote_exact_input(amount_in, zero_for_one)[0]
+
+    # ---- 事件更新 ----
+
+    def _update_position(self, tick_lower: int, tick_upper: int, delta: int):
+        for tick, upper in ((tick_lower, False), (tick_upper, True)):
+            gross, net = self.ticks.get(tick, [0, 0])
+            gross_after = gross + delta
+            net += -delta if upper else delta
+            if (gross == 0) != (gross_after == 0):
+                self._flip_tick(tick)
+            if gross_after == 0:
+                self.ticks.pop(tick, None)
+            else:
+                self.ticks[tick] = [gross_after, net]
+
+        if tick_lower <= self.tick < tick_upper:
+            self.liquidity += delta
+
+    def apply_log(self, log):
+        """按日志更新快照（日志需按区块和 logIndex 顺序传入）"""
+        topic0 = bytes(log['topics'][0])
+        data = bytes(log['data'])
+
+        if topic0 in (SWAP_TOPIC, UNISWAP_SWAP_TOPIC):
+            _, _, sqrt_price, liquidity, tick = decode(
+                ['int256', 'int256', 'uint160', 'uint128', 'int24'], data[:160]
+            )
+            self.sqrt_price_x96, self.liquidity, self.tick = sqrt_price, liquidity, tick
+        elif topic0 in (MINT_TOPIC, BURN_TOPIC):
+            tick_lower = _to_signed(int.from_bytes(bytes(log['topics'][2]), 'big') & 0xffffff, 24)
+            tick_upper = _to_signed(int.from_bytes(bytes(log['topics'][3]), 'big') & 0xffffff, 24)
+            if topic0 == MINT_TOPIC:
+                _, amount, _, _ = decode(['address', 'uint128', 'uint256', 'uint256'], data)
+                delta = amount
+            else:
+                amount, _, _ = decode(['uint128', 'uint256', 'uint256'], data)
+                delta = -amount
+            if delta:
+                self._update_position(tick_lower, tick_upper, delta)
+
+        self.block = max(self.block, log['blockNumber'])
+
+    async def sync(self, w3_async, to_block='latest'):
+        """
+        拉取快照之后的 Swap/Mint/Burn 日志并应用
+        按 LOG_CHUNK_BLOCKS 分段查询，每段完成后推进 self.block，出错时已应用的部分不会重复
+        """
+        if to_block == 'latest':
+            to_block = await w3_async.eth.block_number
+
+        while self.block < to_block:
+            chunk_end = min(self.block + LOG_CHUNK_BLOCKS, to_block)
+            logs = await w3_async.eth.get_logs({
+                'address': self.address,
+                'fromBlock': self.block + 1,
+                'toBlock': chunk_end,
+                'topics': [[SWAP_TOPIC, UNISWAP_SWAP_TOPIC, MINT_TOPIC, BURN_TOPIC]],
+            })
+            for log in sorted(logs, key=lambda l: (l['blockNumber'], l['logIndex'])):
+                self.apply_log(log)
+            self.block = chunk_end
+
+
+async def load_pool(w3_async, address: str, block_identifier=None) -> V3Pool:
+    """
+    从链上读取池子快照
+    slot0/liquidity 等一次 multicall，tick bitmap 按整个 tick 范围批量扫描，
+    再批量读取已初始化 tick 的 liquidityNet，所有读取固定在同一个区块
+    """
+    address = Web3.to_checksum_address(address)
+    block = block_identifier if block_identifier is not None else await w3_async.eth.block_number
+
+    slot0, liquidity, fee, tick_spacing, token0, token1 = await aggregate(w3_async, [
+        Call(address, "slot0()", returns=('uint160', 'int24', 'uint16', 'uint16', 'uint16', 'uint32', 'bool')),
+        Call(address, "liquidity()", returns=('uint128',)),
+        Call(address, "fee()", returns=('uint24',)),
+        Call(address, "tickSpacing()", returns=('int24',)),
+        Call(address, "token0()", returns=('address',)),
+        Call(address, "token1()", returns=('address',)),
+    ], block)
+    if slot0 is None:
+        raise Exception(f"{address} 不是有效的 V3 池子")
+
+    pool = V3Pool(address, token0, token1, fee, tick_spacing, slot0[0], slot0[1], liquidity, block)
+
+    # 扫描 tick bitmap
+    min_word = (MIN_TICK // tick_spacing) >> 8
+    max_word = (MAX_TICK // tick_spacing) >> 8
+    word_positions = list(range(min_word, max_word + 1))
+    words = await aggregate(w3_async, [
+        Call(address, "tickBitmap(int16)", [pos], returns=('uint256',)) for pos in word_positions
+    ], block)
+
+    initialized_ticks = []
+    for word_pos, word in zip(word_positions, words):
+        if not word:
+            continue
+        pool.bitmap[word_pos] = word
+        while word:
+            bit = (word & -word).bit_length() - 1
+            initialized_ticks.append(((word_pos << 8) + bit) * tick_spacing)
+            word &= word - 1
+
+    # 读取已初始化 tick 的流动性
+    tick_infos = await aggregate(w3_async, [
+        Call(address, "ticks(int24)", [tick],
+             returns=('uint128', 'int128', 'uint256', 'uint256', 'int56', 'uint160', 'uint32', 'bool'))
+        for tick in initialized_ticks
+    ], block)
+    for tick, info in zip(initialized_ticks, tick_infos):
+        pool.ticks[tick] = [info[0], info[1]]
+
+    return pool
+
+
+async def quoter_quote(w3_async, pool: V3Pool, token_in: str, amount_in: int, block_identifier='latest') -> int:
+    """通过链上 QuoterV2 报价（用于核对）"""
+    token_in = Web3.to_checksum_address(token_in)
+    token_out = pool.token1 if token_in == pool.token0 else pool.token0
+    result = await aggregate(w3_async, [
+        Call(
+            PANCAKE_V3_QUOTER,
+            "quoteExactInputSingle((address,address,uint256,uint24,uint160))",
+            [(token_in, token_out, amount_in, pool.fee, 0)],
+            returns=('uint256', 'uint160', 'uint32', 'uint256'),
+        )
+    ], block_identifier)
+    return result[0][0] if result[0] is not None else None
+
+
+async def main():
+    try:
+        # 设置命令行参数
+        parser = argparse.ArgumentParser(description='本地 V3 报价并与链上 QuoterV2 核对')
+        parser.add_argument('pool', help='V3 池子地址')
+        parser.add_argument('--amounts', default='0.01,0.1,1,10,100', help='输入数量（按 18 位精度），逗号分隔')
+        parser.add_argument('--reverse', action='store_true', help='以 token1 作为输入')
+        args = parser.parse_args()
+
+        provider, async_provider = build_providers(BSC_RPC)
+        w3_async = AsyncWeb3(async_provider)
+
+        print("读取池子快照...")
+        start = time.perf_counter()
+        pool = await load_pool(w3_async, args.pool)
+        print(f"快照区块 {pool.block}, 已初始化 tick: {len(pool.ticks)}, 耗时: {time.perf_counter() - start:.2f}s")
+
+        token_in = pool.token1 if args.reverse else pool.token0
+        mismatches = 0
+        for amount in args.amounts.split(','):
+            amount_in = Web3.to_wei(float(amount), 'ether')
+
+            start = time.perf_counter()
+            local = pool.quote(token_in, amount_in)
+            local_us = (time.perf_counter() - start) * 1e6
+
+            onchain = await quoter_quote(w3_async, pool, token_in, amount_in, pool.block)
+            status = "一致" if local == onchain else "不一致"
+            if local != onchain:
+                mismatches += 1
+            print(f"输入 {amount}: 本地 {local} ({local_us:.0f}µs), 链上 {onchain} -> {status}")
+
+        print("\n全部一致!" if mismatches == 0 else f"\n{mismatches} 个报价不一致")
+
+    except Exception as e:
+        print(f"发生错误: {str(e)}")
+
+if __name__ == "__main__":
+    asyncio.run(main())